@@ -0,0 +1,206 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'pose-classifier'))
+sys.path.append(os.path.join(ROOT, 'body-tracker'))
+from keypoint_capture import KeypointStream
+from pnn import PNN, SIGMA, TAG, dic, load_model
+from pnn_model import PNNModel, KERNELS
+
+# usage: python bench_pipeline.py [--model <artifact dir | training csv>] [--json out.json] [--baseline old.json]
+# offline replay of the recorded raw 34 keypoint csvs frame by frame through the tracker's KeypointStream (preprocessing)
+# and PNN on back to back windows (classification) - no camera needed. Without --model the classifier is built from
+# the replayed training sets themselves.
+
+WINDOW = 15
+TRAINING_SETS = os.path.join(ROOT, 'utils', 'training-sets')
+LIVE_RECORDING = os.path.join(ROOT, 'utils', 'data_34', '34.csv')
+
+# recording folder -> pose label
+FOLDER_LABELS = {
+	'sitting-raw': 'sitting',
+	'standing-raw': 'standing',
+	'sitting-1hand-raw': 'sitting_1hand',
+	'standing-1hand-raw': 'standing_1hand',
+}
+
+# peak resident set size of this process in MB
+def peak_rss_mb():
+	try:
+		import resource
+	except ImportError:
+		# windows - no resource module
+		import psutil
+		return psutil.Process().memory_info().peak_wset / 2**20
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+# raw frames (N, 34, 3) of a recording - one person seen without a break, as the body_tracking loop gets them
+def raw_frames(path):
+	return pd.read_csv(path).iloc[:, :102].to_numpy(dtype=np.float64).reshape(-1, 34, 3)
+
+# source name -> (recordings, label or None for unlabelled recordings)
+def load_recordings(training_dir, live_path):
+	sources = {}
+	for folder, label in FOLDER_LABELS.items():
+		recordings = [raw_frames(path) for path in sorted(glob.glob(os.path.join(training_dir, folder, '*.csv')))]
+		if recordings:
+			sources[folder] = (recordings, label)
+	if os.path.exists(live_path):
+		sources['data_34'] = ([raw_frames(live_path)], None)
+	return sources
+
+def latency_stats(ms):
+	ms = np.asarray(ms, dtype=np.float64)
+	return {
+		'windows': int(ms.size),
+		'mean_ms': float(ms.mean()),
+		'p50_ms': float(np.percentile(ms, 50)),
+		'p95_ms': float(np.percentile(ms, 95)),
+		'p99_ms': float(np.percentile(ms, 99)),
+		'windows_per_s': float(1000 * ms.size / ms.sum()),
+	}
+
+# preprocessing step - every frame of a recording -> its 57 root relative coordinates, grouped into back to back windows
+# as the classifier builds them (per window timings - the frames of the window); frames the tracker would not publish
+# (keypoints missing) break the run like there, the unfinished window is left out
+def preprocess(recordings):
+	processed = []
+	timings = []
+	for frames in recordings:
+		stream = KeypointStream()
+		rows, elapsed = [], 0.0
+		for raw in frames:
+			start = time.perf_counter()
+			row, _ = stream.add(raw)
+			elapsed += 1000 * (time.perf_counter() - start)
+			if row is None:
+				rows, elapsed = [], 0.0
+				continue
+			rows.append(row)
+			if len(rows) == WINDOW:
+				timings.append(elapsed)
+				processed.append(np.array(rows, dtype=np.float32))
+				rows, elapsed = [], 0.0
+	return processed, timings
+
+# classification step - PNN on every processed window (per window timings)
+def classify(model, processed):
+	timings = []
+	for x in processed:
+		start = time.perf_counter()
+		PNN({'x_test': x}, model.sigma, model.tag, model=model)
+		timings.append(1000 * (time.perf_counter() - start))
+	return timings
+
+def print_stats(name, stats):
+	print(f"{name:>30}: p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  "
+		f"{stats['windows_per_s']:8.1f} windows/s  ({stats['windows']} windows)")
+
+# relative change of the headline numbers against an earlier json report
+def print_baseline(results, baseline):
+	print(f"--- versus baseline {baseline.get('commit')} ---")
+	rows = [('end_to_end', results['overall']['end_to_end'], baseline['overall']['end_to_end'])]
+	rows += [(f"tag {tag}", stats, baseline['tags'][tag]) for tag, stats in results['tags'].items() if tag in baseline.get('tags', {})]
+	for name, new, old in rows:
+		deltas = '  '.join(f"{key} {100 * (new[key] / old[key] - 1):+6.1f}%" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'windows_per_s'))
+		print(f"{name:>30}: {deltas}")
+
+def main():
+	parser = argparse.ArgumentParser(description='Offline preprocessing + classification benchmark on recorded sets')
+	parser.add_argument('--model', default=None, help='model artifact directory or training csv (default: built from the replayed training sets)')
+	parser.add_argument('--training-sets', default=TRAINING_SETS)
+	parser.add_argument('--live', default=LIVE_RECORDING, help='unlabelled raw 34 keypoint recording')
+	parser.add_argument('--tags', type=int, nargs='+', default=sorted(KERNELS))
+	parser.add_argument('--tag-windows', type=int, default=300, help='windows timed per kernel tag')
+	parser.add_argument('--json', default=None, help='write results to json file')
+	parser.add_argument('--baseline', default=None, help='earlier json report to compare against')
+	args = parser.parse_args()
+
+	sources = load_recordings(args.training_sets, args.live)
+	processed = {}
+	results = {'commit': git_commit(), 'sources': {}, 'tags': {}}
+	for name, (recordings, _) in sources.items():
+		processed[name], timings = preprocess(recordings)
+		results['sources'][name] = {'preprocess': timings}
+
+	if args.model:
+		model = load_model(args.model, args.model)
+	else:
+		labelled = [name for name, (_, label) in sources.items() if label is not None]
+		x_train = np.concatenate([x for name in labelled for x in processed[name]])
+		y_train = np.concatenate([np.full(x.shape[0], dic[sources[name][1]]) for name in labelled for x in processed[name]])
+		model = PNNModel(x_train, y_train, SIGMA, TAG)
+	results['model'] = {
+		'rows': int(model.x_train.shape[0]),
+		'dtype': model.x_train.dtype.name,
+		'sigma': float(model.sigma),
+		'tag': int(model.tag),
+	}
+
+	# warm up (BLAS threads, lazily cached normalisers) before anything is timed
+	first = next(iter(processed.values()))[0]
+	PNN({'x_test': first}, model.sigma, model.tag, model=model)
+
+	all_preprocess, all_classify, all_total = [], [], []
+	for name, timings in results['sources'].items():
+		classify_ms = classify(model, processed[name])
+		total_ms = np.add(timings['preprocess'], classify_ms)
+		all_preprocess += timings['preprocess']
+		all_classify += classify_ms
+		all_total += list(total_ms)
+		results['sources'][name] = {
+			'preprocess': latency_stats(timings['preprocess']),
+			'classify': latency_stats(classify_ms),
+			'end_to_end': latency_stats(total_ms),
+		}
+	results['overall'] = {
+		'preprocess': latency_stats(all_preprocess),
+		'classify': latency_stats(all_classify),
+		'end_to_end': latency_stats(all_total),
+	}
+
+	# kernel tags on the same windows, spread over all recordings (classification only)
+	tag_windows = [x for windows in processed.values() for x in windows]
+	tag_windows = tag_windows[::max(1, len(tag_windows) // args.tag_windows)][:args.tag_windows]
+	production_tag = model.tag
+	for tag in args.tags:
+		model.tag = tag
+		PNN({'x_test': tag_windows[0]}, model.sigma, model.tag, model=model)
+		results['tags'][str(tag)] = latency_stats(classify(model, tag_windows))
+	model.tag = production_tag
+	results['peak_rss_mb'] = peak_rss_mb()
+
+	print(f"model: {results['model']['rows']} rows, {results['model']['dtype']}, tag {results['model']['tag']}, "
+		f"sigma {results['model']['sigma']:g}  commit: {results['commit']}")
+	for name, stats in results['sources'].items():
+		print_stats(f"{name} end to end", stats['end_to_end'])
+	for step, stats in results['overall'].items():
+		print_stats(f"overall {step}", stats)
+	for tag, stats in results['tags'].items():
+		print_stats(f"tag {tag} ({'/'.join(KERNELS[int(tag)])})", stats)
+	print(f"peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			print_baseline(results, json.load(f))
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+	main()
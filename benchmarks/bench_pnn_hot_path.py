@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pose-classifier'))
+import read_data
+from pnn import PNN, ActionNotifier, action_events, action_task, load_model
+
+# usage: python bench_pnn_hot_path.py <model artifact dir | training csv> <test csv>
+# per-window latency of the old PNN hot path (figure + 3D axes and a thread per prediction change)
+# versus the lean path (predict + long-lived notifier)
+
+WINDOW = 15
+
+# old PNN body around prediction - figure allocation and per-change thread spawning
+def legacy_window(model, data):
+	ax = plt.subplot(1, 2, 1)
+	fig = plt.subplot(1, 2, 2, projection='3d')
+	fig.view_init(-90, 90)
+	fig.set_xlabel('x')
+	fig.set_ylabel('y')
+	fig.set_zlabel('z')
+	fig.set_xlim(-1.500, 1.500)
+	fig.set_ylim(-1.000, 1.000)
+	fig.set_zlim(-1.000, 1.000)
+
+	predictions = model.predict(data['x_test'])
+	for label in action_events(predictions):
+		thread = threading.Thread(target=action_task, args=(label,))
+		thread.start()
+	return predictions
+
+def lean_window(model, data, notifier):
+	return PNN(data, model.sigma, model.tag, model=model, notifier=notifier)
+
+# both paths run back to back on every window so scoring noise and drift cancel out
+def interleaved(model, windows, notifier):
+	legacy = []
+	lean = []
+	for data in windows:
+		start = time.perf_counter()
+		legacy_window(model, data)
+		legacy.append(1000 * (time.perf_counter() - start))
+
+		start = time.perf_counter()
+		lean_window(model, data, notifier)
+		lean.append(1000 * (time.perf_counter() - start))
+	return np.array(legacy), np.array(lean)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('model', help='model artifact directory or training csv')
+	parser.add_argument('test', help='test csv (57 coordinates + label)')
+	parser.add_argument('--windows', type=int, default=100)
+	args = parser.parse_args()
+
+	model = load_model(args.model, args.model)
+	test, _ = read_data.input(trainpath = args.test, isTrain= False)
+	x = test['x_test']
+	windows = [{'x_test': x[i:i + WINDOW]} for i in range(0, min(x.shape[0], WINDOW * args.windows), WINDOW)]
+
+	notifier = ActionNotifier()
+
+	# first legacy window pays for figure and 3D axes creation
+	start = time.perf_counter()
+	legacy_window(model, windows[0])
+	cold = 1000 * (time.perf_counter() - start)
+
+	legacy, lean = interleaved(model, windows, notifier)
+	notifier.close()
+
+	print(f"legacy first window: {cold:7.2f} ms")
+	for name, latencies in (('legacy', legacy), ('lean', lean)):
+		print(f"{name:>7}: mean {latencies.mean():7.2f} ms  p50 {np.percentile(latencies, 50):7.2f} ms  "
+			f"p95 {np.percentile(latencies, 95):7.2f} ms")
+	print(f"per-window saving: mean {legacy.mean() - lean.mean():.2f} ms, median {np.median(legacy - lean):.2f} ms")
+
+if __name__ == '__main__':
+	main()
@@ -1,116 +1,41 @@
-import pyzed.sl as sl
-import cv2
-import numpy as np
+import argparse
 import pandas as pd
 from datetime import datetime
-from multiprocessing import shared_memory
+import os
+import sys
 import time
 
-BODY_IDX = 34
-CONFIDENCE_THR = 40 # confidence of body_point detection
-FREQ = 2 # fps = 30/FREQ
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'launch'))
+from memory_management import FrameRingWriter, PoseRecordReader, PersonPoseReader, DoorbellRinger, attach_view, attach_latency_trace, \
+    attach_stage_health, PNN_INPUT_MEMORY_NAME, DETECTED_POSE_MEMORY_NAME, PERSON_POSES_MEMORY_NAME, OPERATOR_POLICIES, OPERATOR_POLICY, \
+    DISPLAY_MODES, DISPLAY_MODE
+from keypoint_preprocess import preprocess_window, RAW_COLUMNS, COLUMNS_19
+from people import People
+from display import Display, display_bodies
 
-# shared memory segments
-PNN_INPUT_MEMORY_NAME = "pnn_input"
-DETECTED_POSE_MEMORY_NAME = "detected_pose_code_shm"
+CONFIDENCE_THR = 40 # confidence of body_point detection
 
 # FPS 30 #
 
-#filtering - simple moving mean
-def apply_moving_mean(df, window_size):
-
-    # Create a copy of the original DataFrame to avoid modifying it
-    result_df = df.copy()
-    
-    # Get all column names except the last one
-    columns_to_transform = df.columns[:-1]
-    
-    # Apply moving mean to each column except the last one
-    for column in columns_to_transform:
-        result_df[column] = df[column].rolling(window=window_size, min_periods=1).mean()
-    
-    return result_df
-
 #preprocessing - rearagning acquired input from 34 raw 3d keypoints data to 19 filtered 3d keypoints data with default label
+# (DataFrame wrapper of preprocess_window, the live loop feeds the classifier from the array directly)
 def process_df(df):
+    df = pd.DataFrame(preprocess_window(df[RAW_COLUMNS].to_numpy()), columns=COLUMNS_19, index=df.index)
 
-    #rotating by 180 degree (since the input is inversed)
-    df = df * (-1)
-    
-    # Delete columns related to specific keypoints
-    keypoints_to_remove = [7, 9, 10, 14, 16, 17, 21, 25, 27, 28, 29, 30, 31, 32, 33]
-    cols_to_drop = []
-    
-    for kp in keypoints_to_remove:
-        cols_to_drop.extend([f'x{kp}', f'y{kp}', f'z{kp}'])
-    
-    # Remove any columns that don't actually exist in the DataFrame
-    cols_to_drop = [col for col in cols_to_drop if col in df.columns]
-    
-    # Drop the columns
-    df = df.drop(columns=cols_to_drop)
-    
-    # Find remaining keypoint indices
-    remaining_indices = set()
-    for col in df.columns:
-        if col.startswith('x'):
-            try:
-                idx = int(col[1:])
-                if f'x{idx}' in df.columns and f'y{idx}' in df.columns and f'z{idx}' in df.columns:
-                    remaining_indices.add(idx)
-            except ValueError:
-                pass
-    
-    # Transform coordinates to make keypoint1 the origin (0,0,0)
-    if 1 in remaining_indices:
-        
-        # Process each row to transform coordinates
-        for i, row in df.iterrows():
-            # Get the coordinates of keypoint1
-            x1 = row['x1']
-            y1 = row['y1']
-            z1 = row['z1']
-            
-            # Subtract keypoint1 coordinates from all keypoints
-            for idx in remaining_indices:
-                df.at[i, f'x{idx}'] = row[f'x{idx}'] - x1
-                df.at[i, f'y{idx}'] = row[f'y{idx}'] - y1
-                df.at[i, f'z{idx}'] = row[f'z{idx}'] - z1
-        
-    # Create mapping from old indices to new sequential indices
-    old_to_new = {old: new for new, old in enumerate(sorted(remaining_indices))}
-    
-    # Create a dictionary to store column renames
-    rename_dict = {}
-    for col in df.columns:
-        if col.startswith(('x', 'y', 'z')):
-            try:
-                prefix = col[0]  # 'x', 'y', or 'z'
-                old_idx = int(col[1:])
-                if old_idx in old_to_new:
-                    new_idx = old_to_new[old_idx]
-                    rename_dict[col] = f'{prefix}{new_idx}'
-            except ValueError:
-                pass
-    
-    # Rename the columns
-    df = df.rename(columns=rename_dict)
-    
     # Add a 'label' column with default value 'standing' to match pnn.py syntax 
     df['label'] = 'standing'
-
-    #filtering
-    df = apply_moving_mean(df, 5)
-    
     return df
 
-def main():
+# camera loop - the frames of every tracked person to pnn_input (announced on pnn_input_doorbell), the operator chosen by
+# operator_policy set on pnn_input; display - 'window': images shown by a display thread with the overlay from
+# detected_pose (operator) and person_poses (everyone), 'none': headless, images are never retrieved
+# runs until ESC, stop is set (in-process pipeline) or the process is terminated; returns the exit status
+def run_tracker(pnn_input, pnn_input_doorbell, detected_pose, person_poses, trace, health, stop=None, operator_policy=OPERATOR_POLICY,
+                display=DISPLAY_MODE):
+
+    # camera dependency imported here so process_df stays usable offline (benchmarks, utils)
+    import pyzed.sl as sl
 
-    # Create communication variables
-    detected_pose_code_shm = shared_memory.SharedMemory(name=DETECTED_POSE_MEMORY_NAME) # init it first !!!
-    received_data_shape = (1,)
-    array_dtype = np.int64
-    
     # Create a Camera object
     zed = sl.Camera()
 
@@ -125,8 +50,7 @@ def main():
     err = zed.open(init_params)
     if err != sl.ERROR_CODE.SUCCESS:
         print("Camera Open : "+repr(err)+". Exit program.")
-        detected_pose_code_shm.close()
-        exit()
+        return 1
 
     body_params = sl.BodyTrackingParameters()
     # Different model can be chosen, optimizing the runtime or the accuracy
@@ -149,17 +73,13 @@ def main():
     if err != sl.ERROR_CODE.SUCCESS:
         print("Enable Body Tracking : "+repr(err)+". Exit program.")
         zed.close()
-        detected_pose_code_shm.close()
-        exit()
+        return 1
     
-    # Setup for visualization
-    camera_info = zed.get_camera_information()
-    # Get camera resolution
-    image_width = camera_info.camera_configuration.resolution.width
-    image_height = camera_info.camera_configuration.resolution.height
-    # Create OpenCV named window
-    cv2.namedWindow("ZED Body Tracking", cv2.WINDOW_NORMAL)
-    cv2.resizeWindow("ZED Body Tracking", image_width, image_height)
+    # Setup for visualization - rendered by its own thread, the capture loop only hands it the newest image
+    viewer = None
+    if display == 'window':
+        viewer = Display(detected_pose, person_poses)
+        viewer.start()
     
     # Create image objects
     image = sl.Mat()
@@ -169,41 +89,27 @@ def main():
     body_runtime_param = sl.BodyTrackingRuntimeParameters()
     body_runtime_param.detection_confidence_threshold = CONFIDENCE_THR
     
-    #csv variables
-    header = []
-    for l in range(34):
-        header.extend([f'x{l}', f'y{l}', f'z{l}'])
-    
-    poses_dict = {"[0]" : "sitting", "[1]": "standing", "[2]" : "sitting_1hand", "[3]": "standing_1hand"}
-    
     #initializing variables
+    # frame number of the body data - counts new bodies only, a failed grab or a pass without new bodies is no gap
     i = 0 
-    body_detected_idx = 0
-    keypoint_3d_row = np.ones((BODY_IDX*3), dtype=float)
-
-    #create frame
-    # Create the window with a name
-    cv2.namedWindow("ZED Body Tracking", cv2.WINDOW_NORMAL)
-
-    # Set fixed size: width=300, height=400
-    cv2.resizeWindow("ZED Body Tracking", 900, 600)
+    # per body.id keypoint streams and the operator
+    people = People(operator_policy)
 
-    # Move window to top-left corner of screen (x=0, y=0)
-    cv2.moveWindow("ZED Body Tracking", 0, 0)
+    # camera open and body tracking running - ready for the launcher
+    health.ready()
 
     #body tracking
     try:
-        while True:
+        while stop is None or not stop.is_set():
+            health.beat()
+            grab_start = time.perf_counter()
             if zed.grab() == sl.ERROR_CODE.SUCCESS:
-                # Retrieve the left image
-                zed.retrieve_image(image, sl.VIEW.LEFT)
-                
+                # grab time of the frame - origin of the latency trace of the rows (and windows) made of it
+                grabbed = trace.span('grab', grab_start)
+
                 # Retrieve bodies
                 err = zed.retrieve_bodies(bodies, body_runtime_param)
                 
-                # Convert sl.Mat to OpenCV Mat
-                img_cv = image.get_data()
-                
                 # Draw skeleton for each detected person
                 if bodies.is_new and bodies.body_list:
                     # print(f"{len(bodies.body_list)} Person(s) detected")
@@ -211,77 +117,79 @@ def main():
                     # Iterate through all detected bodies
                     for idx, body in enumerate(bodies.body_list):
                         
-                        # Get 3D keypoints and transform the to (102,1) form
-                        keypoint_3d = np.array([body.keypoint])
-                        for j in range (0, BODY_IDX):
-                            keypoint_3d_row[3*j:3*j + 3] = keypoint_3d[0][j]
-
-                        # append to output 3D keypoints matrix
-                        if body_detected_idx == 0:
-                            keypoint_3d_array = keypoint_3d_row
-                            body_detected_idx += 1
+                        # 3D keypoints (34, 3) of this person -> its classifier row (57 coordinates), preprocessed with
+                        # the state carried over from its previous frames, unreliable keypoints masked out; the position is
+                        # in the camera frame (default runtime parameters), i.e. already relative to the camera
+                        person = people.update(body.id, body.keypoint, body.position, body.bounding_box_2d, i,
+                                               body.keypoint_confidence)
+
+                        # every frame is published to the classifier (pnn_input ring) with its frame number -
+                        # a frame still missing keypoints after the held ones is not worth classifying
+                        if person.row is None:
+                            pnn_input.discard()
                         else:
-                            keypoint_3d_array = np.append(keypoint_3d_array, keypoint_3d_row, axis=0)
-                            body_detected_idx +=1
-                        
-                # create dataframe every 15 frames - to be used by predictor:
-                if body_detected_idx == int(30/FREQ):
-
-                    #arrange 102x10 matrix from 1x1020 array  
-                    keypoint_3d_matrix = np.zeros((body_detected_idx,102), dtype = float)
-                    for k in range (0, body_detected_idx):
-                        keypoint_3d_matrix[k] = keypoint_3d_array[k*102:k*102+102]
-                    
-                    df = pd.DataFrame(keypoint_3d_matrix, columns = header)
-
-                    # preprocess data
-                    df = process_df(df=df)
-
-                    # save df as csv in prod directory
-                    df.to_csv(r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\19.csv', index= False)
+                            pnn_input.write(person.row, origin=grabbed, body_id=person.body_id, frame=i,
+                                            repaired=person.repaired)
+                            trace.span('preprocess', grabbed)
+                    pnn_input_doorbell.ring()
+
+                # operator - the person whose poses drive actions
+                operator = people.operator
+                if people.choose_operator(i) != operator:
+                    pnn_input.set_operator(people.operator)
+                    print(f"[Tracker]: operator is now body {people.operator} ({operator_policy})")
+
+                if viewer is not None:
+                    # ESC pressed in the display window
+                    if viewer.closed.is_set():
+                        health.stopped()
+                        break
+
+                    # Retrieve the left image - only when the display is ready for a new one
+                    if viewer.wanted():
+                        zed.retrieve_image(image, sl.VIEW.LEFT)
+                        viewer.show(image.get_data(), display_bodies(bodies.body_list), people.operator)
+
+                if bodies.is_new:
+                    i += 1
 
-                    #reset variables
-                    body_detected_idx = 0      
-
-                # Draw informative text on img
-                pose_value_arr = "Undetected"
-
-                try:
-                    pose_value_arr = np.ndarray(received_data_shape, dtype=array_dtype, buffer=detected_pose_code_shm.buf)
-                    pose_string = poses_dict[str(pose_value_arr)]
-
-                except Exception as e:
-                    print(f"Bład: {e}")
+    except KeyboardInterrupt:
+        pass
 
-                cv2.putText(
-                    img_cv,                     # Image to draw on
-                    pose_string,                 # Text
-                    (10, 300),                   # Position (x=10, y=30)
-                    cv2.FONT_HERSHEY_SIMPLEX,   # Font
-                    5,                          # Font scale
-                    (0, 0, 255),                # Color (Green in BGR)
-                    5,                          # Thickness
-                    cv2.LINE_AA                 # Line type for anti-aliasing
-                )    
+    # Close the camera and the display
+    if viewer is not None:
+        viewer.stop()
+    zed.disable_body_tracking()
+    zed.close()
+    return 0
 
-                # Display the image
-                cv2.imshow("ZED Body Tracking", img_cv)
-                
-                # Handle keyboard input
-                key = cv2.waitKey(10)
-                if key == 27:  # ESC key
-                    detected_pose_code_shm.close()
-                    break
-                    
-            i += 1
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--operator', choices=OPERATOR_POLICIES, default=OPERATOR_POLICY,
+                        help='which of the people in view drives the actions')
+    parser.add_argument('--display', choices=DISPLAY_MODES, default=DISPLAY_MODE,
+                        help="'window' - camera image with poses (own thread), 'none' - headless")
+    args = parser.parse_args()
 
-        # Close the camera and destroy windows
-        zed.disable_body_tracking()
-        zed.close()
-        cv2.destroyAllWindows()
-    
-    except KeyboardInterrupt:
-        detected_pose_code_shm.close()
+    # Create communication variables
+    detected_pose = attach_view(DETECTED_POSE_MEMORY_NAME, PoseRecordReader) # init it first !!!
+    person_poses = attach_view(PERSON_POSES_MEMORY_NAME, PersonPoseReader)
+    pnn_input = attach_view(PNN_INPUT_MEMORY_NAME, FrameRingWriter)
+    pnn_input_doorbell = DoorbellRinger(PNN_INPUT_MEMORY_NAME)
+    trace = attach_latency_trace()
+    health = attach_stage_health('tracker')
+
+    status = run_tracker(pnn_input, pnn_input_doorbell, detected_pose, person_poses, trace, health, operator_policy=args.operator,
+                         display=args.display)
+
+    detected_pose.close()
+    person_poses.close()
+    pnn_input.close()
+    pnn_input_doorbell.close()
+    trace.close()
+    health.close()
+    if status:
+        exit(status)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,8 @@
 import pyzed.sl as sl
 import cv2
-import numpy as np
-import pandas as pd
 from datetime import datetime
+from keypoint_capture import ChunkedRecorder
 
-BODY_IDX = 34
 FRAMES = 2000
 
 def main():
@@ -85,9 +83,13 @@ def main():
         [9, 10], [12, 13]
     ]
     
+    # csv file - frames are streamed to it in chunks while recording
+    now = datetime.now()
+    time_string = now.strftime("%d-%m-%Y-%H-%M-%S")
+    recorder = ChunkedRecorder(time_string + '.csv')
+    # recorder = ChunkedRecorder('34.csv')
+
     i = 0 
-    body_detected_idx = 0
-    keypoint_3d_row = np.ones((BODY_IDX*3), dtype=float)
     while i < FRAMES:
         if zed.grab() == sl.ERROR_CODE.SUCCESS:
             # Retrieve the left image
@@ -109,18 +111,8 @@ def main():
                     color_idx = idx % len(colors)
                     skeleton_color = colors[color_idx]
                     
-                    # Get 3D keypoints and transform the to (102,1) form
-                    keypoint_3d = np.array([body.keypoint])
-                    for j in range (0, BODY_IDX):
-                        keypoint_3d_row[3*j:3*j + 3] = keypoint_3d[0][j]
-
-                    # append to output 3D keypoints matrix
-                    if body_detected_idx == 0:
-                        keypoint_3d_array = keypoint_3d_row
-                        body_detected_idx += 1
-                    else:
-                        keypoint_3d_array = np.append(keypoint_3d_array, keypoint_3d_row, axis=0)
-                        body_detected_idx +=1
+                    # 3D keypoints (34, 3) - one row of the csv
+                    recorder.add(body.keypoint)
                     
             #         # Draw keypoints
             #         for j, kp in enumerate(keypoint_2d):
@@ -175,21 +167,9 @@ def main():
                 
         i += 1
         
-    #postprocess matrix
-    keypoint_3d_matrix = np.zeros((body_detected_idx,102), dtype = float)
-    for k in range (0, body_detected_idx):
-        keypoint_3d_matrix[k] = keypoint_3d_array[k*102:k*102+102]
-
-    #save to csv file
-    header = []
-    for l in range(34):
-        header.extend([f'x{l}', f'y{l}', f'z{l}'])
-
-    df = pd.DataFrame(keypoint_3d_matrix, columns = header)
-    now = datetime.now()
-    time_string = time_string = now.strftime("%d-%m-%Y-%H-%M-%S")
-    df.to_csv(time_string + '.csv', index = False)
-    # df.to_csv('34.csv', index= False)
+    #save the rest of the frames to the csv file
+    rows = recorder.close()
+    print(f"{rows} frames saved to {recorder.path}" if rows else "No body detections to save")
 
     # Close the camera and destroy windows
     zed.disable_body_tracking()
@@ -1,11 +1,9 @@
 import pyzed.sl as sl
 import cv2
-import numpy as np
-import pandas as pd
 from datetime import datetime
 import threading
+from keypoint_capture import ChunkedRecorder
 
-BODY_IDX = 34
 FRAMES = 400
 
 def process_camera(camera_id):
@@ -77,10 +75,12 @@ def process_camera(camera_id):
     # Skeleton color and keypoint connections for visualization
     colors = [(0, 255, 0), (0, 0, 255), (255, 0, 0), (255, 255, 0), (0, 255, 255)]  # BGR format
     
+    # CSV file - frames are streamed to it in chunks while recording
+    now = datetime.now()
+    time_string = now.strftime("%d-%m-%Y-%H-%M-%S")
+    recorder = ChunkedRecorder(f"{camera_name}_{time_string}.csv")
+
     i = 0 
-    body_detected_idx = 0
-    keypoint_3d_row = np.ones((BODY_IDX*3), dtype=float)
-    keypoint_3d_array = np.array([])
     
     while i < FRAMES:
         if zed.grab() == sl.ERROR_CODE.SUCCESS:
@@ -103,18 +103,8 @@ def process_camera(camera_id):
                     color_idx = idx % len(colors)
                     skeleton_color = colors[color_idx]
                     
-                    # Get 3D keypoints and transform them to (102,1) form
-                    keypoint_3d = np.array([body.keypoint])
-                    for j in range(0, BODY_IDX):
-                        keypoint_3d_row[3*j:3*j + 3] = keypoint_3d[0][j]
-
-                    # append to output 3D keypoints matrix
-                    if body_detected_idx == 0:
-                        keypoint_3d_array = keypoint_3d_row.copy()
-                        body_detected_idx += 1
-                    else:
-                        keypoint_3d_array = np.append(keypoint_3d_array, keypoint_3d_row)
-                        body_detected_idx += 1
+                    # 3D keypoints (34, 3) - one row of the CSV
+                    recorder.add(body.keypoint)
             
             # Display the image
             cv2.imshow(window_name, img_cv)
@@ -126,21 +116,9 @@ def process_camera(camera_id):
                 
         i += 1
     
-    # Postprocess matrix
-    if body_detected_idx > 0:
-        keypoint_3d_array = keypoint_3d_array.reshape(body_detected_idx, BODY_IDX*3)
-        
-        # Save to CSV file
-        header = []
-        for l in range(BODY_IDX):
-            header.extend([f'x{l}', f'y{l}', f'z{l}'])
-
-        df = pd.DataFrame(keypoint_3d_array, columns=header)
-        now = datetime.now()
-        time_string = now.strftime("%d-%m-%Y-%H-%M-%S")
-        csv_filename = f"{camera_name}_{time_string}.csv"
-        df.to_csv(csv_filename, index=False)
-        print(f"{camera_name}: Data saved to {csv_filename}")
+    # Save the rest of the frames to the CSV file
+    if recorder.close() > 0:
+        print(f"{camera_name}: Data saved to {recorder.path}")
     else:
         print(f"{camera_name}: No body detections to save")
 
@@ -0,0 +1,121 @@
+import threading
+import time
+import numpy as np
+
+WINDOW_NAME = "ZED Body Tracking"
+# frames per second the display renders at most - the capture loop runs at the camera rate whatever this is
+DISPLAY_FPS = 15
+
+POSE_NAMES = {0: "sitting", 1: "standing", 2: "sitting_1hand", 3: "standing_1hand"}
+# per person poses older than this (seconds) are not shown
+PERSON_POSE_MAX_AGE = 2.0
+
+class FrameSlot:
+    """single slot between the capture loop and the display - a new frame replaces one that was not shown yet"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.frame = None
+
+    # the display took the previous frame - only then is a new image worth retrieving
+    def wanted(self):
+        return not self.ready.is_set()
+
+    def put(self, frame):
+        with self.lock:
+            self.frame = frame
+        self.ready.set()
+
+    # newest frame, None when nothing new arrived within timeout
+    def take(self, timeout):
+        if not self.ready.wait(timeout):
+            return None
+        with self.lock:
+            frame, self.frame = self.frame, None
+            self.ready.clear()
+        return frame
+
+class Display:
+    """display thread - shows the newest captured image with the pose overlay at its own rate (all cv2 calls are
+    made by this thread); ESC in the window sets closed"""
+
+    def __init__(self, detected_pose, person_poses, fps=DISPLAY_FPS):
+        self.detected_pose = detected_pose
+        self.person_poses = person_poses
+        self.period = 1.0 / fps
+        self.slot = FrameSlot()
+        self.closed = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='display', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def wanted(self):
+        return self.slot.wanted() and not self.closed.is_set()
+
+    # capture loop side - image is copied (the camera reuses its buffer), bodies: (body id, 2D bounding box) of the frame
+    def show(self, image, bodies, operator):
+        self.slot.put((image.copy(), bodies, operator))
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join(timeout=2)
+
+    def draw(self, cv2, image, bodies, operator):
+        # Draw informative text on img - pose of the operator
+        pose_string = "Undetected"
+
+        # latest consistent pose record (seq 0 - nothing classified yet)
+        pose_record = self.detected_pose.read()
+        if pose_record is not None and pose_record.seq > 0:
+            pose_string = POSE_NAMES.get(pose_record.class_id, pose_string)
+
+        cv2.putText(
+            image,                      # Image to draw on
+            pose_string,                # Text
+            (10, 300),                  # Position (x=10, y=300)
+            cv2.FONT_HERSHEY_SIMPLEX,   # Font
+            5,                          # Font scale
+            (0, 0, 255),                # Color (Red in BGR)
+            5,                          # Thickness
+            cv2.LINE_AA                 # Line type for anti-aliasing
+        )
+
+        # pose of every person in view next to them (* - operator)
+        poses = self.person_poses.read_all(PERSON_POSE_MAX_AGE)
+        for body_id, box in bodies:
+            record = poses.get(body_id)
+            label = POSE_NAMES.get(record.class_id, "?") if record is not None else "..."
+            marker = "*" if body_id == operator else ""
+            if box.size:
+                cv2.putText(image, f"{marker}{body_id}: {label}", (int(box[0][0]), max(int(box[0][1]) - 10, 20)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
+
+    def run(self):
+        import cv2
+
+        # Create the window with a fixed size in the top-left corner of screen
+        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(WINDOW_NAME, 900, 600)
+        cv2.moveWindow(WINDOW_NAME, 0, 0)
+
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            item = self.slot.take(self.period)
+            if item is not None:
+                image, bodies, operator = item
+                self.draw(cv2, image, bodies, operator)
+                cv2.imshow(WINDOW_NAME, image)
+
+            # Handle keyboard input (also keeps the window responsive) - paces the display to its rate
+            wait = max(1, int(1000 * (self.period - (time.monotonic() - started))))
+            if cv2.waitKey(wait) == 27:  # ESC key
+                self.closed.set()
+                break
+        cv2.destroyAllWindows()
+
+# bodies of a frame as the display needs them
+def display_bodies(body_list):
+    return [(body.id, np.asarray(body.bounding_box_2d)) for body in body_list]
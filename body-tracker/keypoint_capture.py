@@ -0,0 +1,104 @@
+import numpy as np
+from keypoint_preprocess import BODY_34, RAW_COLUMNS, KEPT_KEYPOINTS, ROOT_KEYPOINT, MOVING_MEAN_WINDOW, MAX_GAP, \
+    MIN_KEYPOINT_CONFIDENCE
+
+# camera loop side of the keypoints - fixed buffers filled straight from body.keypoint, every step of the
+# preprocessing runs in place on them; the only per frame allocation is the classifier row handed over
+RECORD_CHUNK = 256
+
+class KeypointStream:
+    """causal preprocessing of the frames of one person - every frame becomes its classifier row (57 float32 coordinates)
+    right away: kept keypoints, root relative, moving mean over the last MOVING_MEAN_WINDOW frames carried from frame to
+    frame (the rows preprocess_window gives for the whole run of frames); a missing keypoint is held at its last located
+    position for up to max_gap frames"""
+
+    def __init__(self, window=MOVING_MEAN_WINDOW, max_gap=MAX_GAP):
+        kept = len(KEPT_KEYPOINTS)
+        # root relative frames of the moving mean (ring) and the latest located position of every kept keypoint
+        self.recent = np.zeros((window, kept, 3))
+        self.last = np.zeros((kept, 3))
+        self.missing = np.zeros(kept, dtype=np.int64)
+        # per frame scratch
+        self.keypoints = np.zeros((BODY_34, 3))
+        self.kept = np.zeros((kept, 3))
+        self.finite = np.zeros((kept, 3), dtype=bool)
+        self.confident_34 = np.zeros(BODY_34, dtype=bool)
+        self.confident = np.zeros(kept, dtype=bool)
+        self.located = np.zeros(kept, dtype=bool)
+        self.lost = np.zeros(kept, dtype=bool)
+        self.total = np.zeros((kept, 3))
+        self.max_gap = max_gap
+        self.reset()
+
+    # the next frame starts the run over (nothing to average with, no keypoint position to hold)
+    def reset(self):
+        self.count = 0
+        self.missing[:] = self.max_gap + 1
+
+    # keypoints (34, 3) of the next frame, with their confidences (34,) the unreliable ones count as missing -
+    # returns (row, repaired): row None when a keypoint is missing for too long (the run starts over with the next
+    # frame), repaired - some keypoints were held
+    def add(self, keypoints, confidence=None):
+        # kept keypoints rotated by 180 degrees (select_keypoints) - located: finite and confident enough (keypoint_mask)
+        np.negative(keypoints, out=self.keypoints)
+        np.take(self.keypoints, KEPT_KEYPOINTS, axis=0, out=self.kept)
+        np.isfinite(self.kept, out=self.finite)
+        np.all(self.finite, axis=-1, out=self.located)
+        if confidence is not None:
+            np.greater_equal(confidence, MIN_KEYPOINT_CONFIDENCE, out=self.confident_34)
+            np.take(self.confident_34, KEPT_KEYPOINTS, out=self.confident)
+            np.logical_and(self.located, self.confident, out=self.located)
+
+        # frames every keypoint has been missing for, the located ones replace their held position
+        np.logical_not(self.located, out=self.lost)
+        np.add(self.missing, self.lost, out=self.missing)
+        np.multiply(self.missing, self.lost, out=self.missing)
+        np.copyto(self.last, self.kept, where=self.located[:, None])
+        if self.missing.max() > self.max_gap:
+            self.reset()
+            np.multiply(self.missing, self.lost, out=self.missing)
+            return None, False
+
+        frame = self.recent[self.count % len(self.recent)]
+        np.subtract(self.last, self.last[ROOT_KEYPOINT], out=frame)
+        self.count += 1
+        frames = min(self.count, len(self.recent))
+        np.sum(self.recent[:frames], axis=0, out=self.total)
+        row = np.empty(self.total.size, dtype=np.float32)
+        np.divide(self.total.reshape(-1), frames, out=row)
+        return row, bool(self.lost.any())
+
+class ChunkedRecorder:
+    """raw 34 keypoint csv recorder (x0, y0, z0, ... z33 - the format of utils/data_34) - frames are collected in a
+    preallocated chunk that is appended to the file whenever it fills up; the file is created with the first chunk"""
+
+    def __init__(self, path, chunk=RECORD_CHUNK):
+        self.path = path
+        self.chunk = np.zeros((chunk, BODY_34, 3), dtype=np.float32)
+        self.count = 0
+        self.rows = 0
+        self.file = None
+
+    def add(self, keypoints):
+        self.chunk[self.count] = keypoints
+        self.count += 1
+        if self.count == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='')
+            self.file.write(','.join(RAW_COLUMNS) + '\n')
+        np.savetxt(self.file, self.chunk[:self.count].reshape(self.count, -1), fmt='%.9g', delimiter=',')
+        self.rows += self.count
+        self.count = 0
+
+    # writes the last partial chunk - returns the number of recorded frames (0: no file was created)
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self.rows
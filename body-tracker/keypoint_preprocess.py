@@ -0,0 +1,55 @@
+import numpy as np
+
+# ZED BODY_34 -> 19 keypoint model used by the classifier (live tracker and offline csv tools)
+BODY_34 = 34
+REMOVED_KEYPOINTS = [7, 9, 10, 14, 16, 17, 21, 25, 27, 28, 29, 30, 31, 32, 33]
+KEPT_KEYPOINTS = np.array([kp for kp in range(BODY_34) if kp not in REMOVED_KEYPOINTS])
+# keypoint 1 (pelvis) becomes the origin - index 1 among the kept ones as well
+ROOT_KEYPOINT = int(np.flatnonzero(KEPT_KEYPOINTS == 1)[0])
+MOVING_MEAN_WINDOW = 5
+
+# live frames - keypoints the ZED locates with less confidence (0 - 100) count as missing, a missing kept keypoint is
+# held at its last located position for up to MAX_GAP frames, a frame with one missing for longer is not classified
+MIN_KEYPOINT_CONFIDENCE = 30
+MAX_GAP = 3
+
+# raw csv / dataframe columns (x0, y0, z0, ... z33) and the ones of the 19 keypoint model (renumbered 0..18)
+RAW_COLUMNS = [f'{axis}{kp}' for kp in range(BODY_34) for axis in 'xyz']
+COLUMNS_19 = [f'{axis}{kp}' for kp in range(len(KEPT_KEYPOINTS)) for axis in 'xyz']
+
+# (N, 102) raw rows -> (N, 19, 3) kept keypoints, rotated by 180 degrees (the camera input is inversed)
+def select_keypoints(raw):
+    keypoints = np.asarray(raw, dtype=np.float64).reshape(-1, BODY_34, 3)
+    return np.negative(keypoints[:, KEPT_KEYPOINTS])
+
+# every keypoint relative to the root keypoint of its frame (in place)
+def root_center(keypoints):
+    keypoints -= keypoints[:, ROOT_KEYPOINT:ROOT_KEYPOINT + 1].copy()
+    return keypoints
+
+# causal moving mean over the first axis (frames), the window is shorter at the start - like
+# DataFrame.rolling(window, min_periods=1).mean(): NaN values (keypoints the camera lost) are left out of the mean
+def moving_mean(x, window, out=None):
+    valid = ~np.isnan(x)
+    values = np.where(valid, x, 0.0)
+    total = values.copy()
+    count = valid.astype(np.float64)
+    for shift in range(1, min(window, x.shape[0])):
+        total[shift:] += values[:-shift]
+        count[shift:] += valid[:-shift]
+    if out is None:
+        out = total
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(total, count, out=out)
+    out[count == 0] = np.nan
+    return out
+
+# raw window -> (N, 57) root relative, filtered coordinates the classifier is fed with
+def preprocess_window(raw, window=MOVING_MEAN_WINDOW):
+    keypoints = root_center(select_keypoints(raw))
+    return moving_mean(keypoints, window).reshape(keypoints.shape[0], -1)
+
+# validity of every keypoint (..., 34) - confident enough and located (the SDK reports NaN for keypoints it lost)
+def keypoint_mask(keypoints, confidence, min_confidence=MIN_KEYPOINT_CONFIDENCE):
+    with np.errstate(invalid='ignore'):
+        return (np.asarray(confidence) >= min_confidence) & np.isfinite(keypoints).all(axis=-1)
@@ -0,0 +1,79 @@
+import os
+import sys
+import numpy as np
+from keypoint_capture import KeypointStream
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'launch'))
+from memory_management import OPERATOR_POLICIES, OPERATOR_POLICY, NO_BODY
+
+# a person not seen for this many grabbed frames is forgotten together with its unfinished window (1 s at 30 fps)
+PERSON_TIMEOUT = 30
+# someone else takes over as operator only when better than the current one by this share of its score
+OPERATOR_MARGIN = 0.2
+
+class Person:
+    """tracked body - its keypoint stream and classifier row of the latest frame (None: not classifiable), frames it was
+    first / last seen in, latest distance and image size"""
+
+    def __init__(self, body_id, frame):
+        self.body_id = body_id
+        self.stream = KeypointStream()
+        self.row = None
+        self.repaired = False
+        self.first_seen = frame
+        self.last_seen = frame
+        self.distance = np.inf
+        self.area = 0.0
+
+# operator policy score of a person - higher is better
+def operator_score(person, policy, frame):
+    if policy == 'closest':
+        return -person.distance
+    if policy == 'largest':
+        return person.area
+    return frame - person.first_seen
+
+class People:
+    """per body.id state of everyone in view (ZED tracking ids) and the operator chosen among them"""
+
+    def __init__(self, policy=OPERATOR_POLICY, timeout=PERSON_TIMEOUT):
+        if policy not in OPERATOR_POLICIES:
+            raise ValueError(f"Unknown operator policy: {policy}")
+        self.policy = policy
+        self.timeout = timeout
+        self.persons = {}
+        self.operator = NO_BODY
+
+    # one body detected in frame - keypoints (34, 3) go through the person's own stream (masked by their confidence (34,))
+    # into person.row; position relative to the camera, box - 2D bounding box corners in the image
+    # a stream runs over consecutive frames only - it starts over for a person missing from the frame before
+    def update(self, body_id, keypoints, position, box, frame, confidence=None):
+        person = self.persons.get(body_id)
+        if person is None:
+            person = self.persons[body_id] = Person(body_id, frame)
+        elif frame - person.last_seen > 1:
+            person.stream.reset()
+        person.row, person.repaired = person.stream.add(keypoints, confidence)
+        person.last_seen = frame
+        person.distance = float(np.linalg.norm(position))
+        box = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+        person.area = float(np.ptp(box[:, 0]) * np.ptp(box[:, 1])) if len(box) else 0.0
+        return person
+
+    # after the bodies of frame - forgets people gone for too long and returns the operator (NO_BODY: nobody around);
+    # the operator stays while tracked unless someone in view beats it by OPERATOR_MARGIN
+    def choose_operator(self, frame):
+        for body_id in [body_id for body_id, person in self.persons.items() if frame - person.last_seen > self.timeout]:
+            del self.persons[body_id]
+        current = self.persons.get(self.operator)
+        visible = [person for person in self.persons.values() if person.last_seen == frame]
+        if not visible:
+            self.operator = NO_BODY if current is None else self.operator
+            return self.operator
+        best = max(visible, key=lambda person: operator_score(person, self.policy, frame))
+        if current is not None and best is not current:
+            score = operator_score(current, self.policy, frame)
+            if operator_score(best, self.policy, frame) - score <= OPERATOR_MARGIN * abs(score):
+                return self.operator
+        self.operator = best.body_id
+        return self.operator
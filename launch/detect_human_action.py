@@ -1,91 +1,116 @@
+import os
 import time
-import numpy as np
 import signal
-from multiprocessing import shared_memory
-from memory_management import DETECTED_POSE_MEMORY_NAME
+from gesture_engine import GestureEngine
+from memory_management import PoseRecordReader, ActionEventWriter, Doorbell, DoorbellRinger, attach_view, attach_latency_trace, attach_stage_health, \
+    DETECTED_POSE_MEMORY_NAME, ACTION_EVENTS_MEMORY_NAME, ACTION_CODE_CHANNEL
 
 POSE_ENDPOINT_PATH = r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\action_code.txt'
 
-#function retrieving detected pose code from endpoint (.txt file)
-def get_pose(received_data_shape, shm_buffer):
+# predictions older than this (seconds since the classifier wrote them) do not drive actions
+POSE_STALE_AFTER = 1.0
 
-    try:
-        pose_value_arr = np.ndarray(received_data_shape, dtype=np.int64, buffer=shm_buffer.buf)
-        return pose_value_arr[0]
+#function retrieving detected pose record from shared memory - None until the classifier publishes a new one
+def get_pose(pose_reader):
+    return pose_reader.read_new()
 
+# publishes detected action - event queue read by the spot controller, action_code.txt kept as fallback endpoint
+# record - pose record that completed the sequence (its window id and grab time trace the action)
+# action_doorbell - wakes the spot controller (ActionSubscriber) after a new action was published
+def publish_action(action_id, seq, action_events=None, record=None, action_doorbell=None):
+    if action_events is not None:
+        if record is None:
+            action_events.publish(action_id, seq)
+        else:
+            action_events.publish(action_id, seq, trace_id=record.window_id, origin=record.origin)
+    try:
+        with open(POSE_ENDPOINT_PATH, 'w') as f:
+            f.write(str(action_id))
     except Exception as e:
-        print(f"Bład: {e}")
-
-# fucntion for handling acquiried sequence
-def handle_sequence(seq):
-    
-    # sitting - standing - sitting (covering possible classifier errors)
-    # if seq[-3:] == '010':
-    if seq == 'bb010':
-        try:
-            with open(POSE_ENDPOINT_PATH, 'w') as f:
-                f.write('1')
-        except Exception as e:
-            print(e)
+        print(e)
+        if action_events is None:
             return False
-        return True
-    
-    if seq == 'aa010':
-        try:
-            with open(POSE_ENDPOINT_PATH, 'w') as f:
-                f.write('3')
-        except Exception as e:
-            print(e)
-            return False
-        return True
+    if action_doorbell is not None:
+        action_doorbell.ring()
+    return True
+
+# pose sequence -> action table (patterns, optional timing), see gesture_engine.py
+GESTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gestures.json')
+
+# fucntion for handling acquiried pose - publishes the action of a gesture it completes
+def handle_pose(engine, record, action_events=None, action_doorbell=None):
+    gesture = engine.push(record.class_id, record.origin)
+    if gesture is None:
+        return False
+    seq = engine.sequence()
+    if not publish_action(gesture.action, seq, action_events, record, action_doorbell):
+        return False
+    print(seq)
+    engine.reset()
+    return True
     
-    # standing - standing 1hand - standing - standing 1hand
-    if seq[-4:] == '1313':
-        try:
-            with open(POSE_ENDPOINT_PATH, 'w') as f:
-                f.write('2')
-        except Exception as e:
-            print(e)
-            return False
-        return True
-    return False
+# detection loop - pose records from pose_reader (woken by pose_doorbell), actions to action_events (announced on
+# action_doorbell); runs until stop is set (in-process pipeline) or the process is terminated
+def detect(pose_reader, pose_doorbell, action_events, action_doorbell, trace, health, stop=None, engine=None):
+    engine = engine or GestureEngine.load(GESTURES_PATH)
+    # body id of the operator whose poses the engine has seen - a gesture never spans two people
+    operator = None
+    health.ready()
+
+    while stop is None or not stop.is_set():
+        health.beat()
+        record = get_pose(pose_reader)
+        if record is None:
+            pose_doorbell.wait()
+            continue
+
+        staleness = time.perf_counter() - record.timestamp
+        if staleness > POSE_STALE_AFTER:
+            print(f"[Detector Module]: stale pose record {record.seq} ({staleness:.2f} s) skipped")
+            continue
+
+        if operator is not None and record.body_id != operator:
+            print(f"[Detector Module]: operator changed to body {record.body_id}, gesture history restarted")
+            engine.restart()
+        operator = record.body_id
+
+        handle_pose(engine, record, action_events, action_doorbell)
+        trace.span('detect', record.timestamp)
     
 def main():
     # mapping onto memory segment holding pose values
-    shm = shared_memory.SharedMemory(name=DETECTED_POSE_MEMORY_NAME) # init it first !!!
-    received_data_shape = (1,)
+    pose_reader = attach_view(DETECTED_POSE_MEMORY_NAME, PoseRecordReader) # init it first !!!
+    action_events = attach_view(ACTION_EVENTS_MEMORY_NAME, ActionEventWriter)
+
+    # woken by the classifier on every new pose code, wakes the spot controller on every new action
+    pose_doorbell = Doorbell(DETECTED_POSE_MEMORY_NAME)
+    action_doorbell = DoorbellRinger(ACTION_CODE_CHANNEL)
+    trace = attach_latency_trace()
+    health = attach_stage_health('detector')
 
     #handling termination from parent process
     def cleanup(signum=None, frame=None):
         print("[Detector Module]: cleaning up shared memory...")
-        shm.close()
+        pose_doorbell.close()
+        action_doorbell.close()
+        pose_reader.close()
+        action_events.close()
+        trace.close()
+        health.close()
         exit(0)
     signal.signal(signal.SIGTERM, cleanup)
     signal.signal(signal.SIGINT, cleanup)
 
-    sequence = 'aa' # starting seq cant be null due to sequence length
-    prev_pose = None
-    sequence_handled = False
-
     try:
-        while(True):
-            pose = get_pose(received_data_shape=received_data_shape, shm_buffer=shm)
-
-            if pose != prev_pose:
-                sequence += str(pose)
-                prev_pose = pose
-            
-            if len(sequence) > 4:
-                sequence_handled = handle_sequence(sequence)
-
-            if sequence_handled:
-                print(sequence)
-                sequence = 'bb'
-                prev_pose = None
-                sequence_handled = False
-    
+        detect(pose_reader, pose_doorbell, action_events, action_doorbell, trace, health)
+
     except KeyboardInterrupt:
-        shm.close()
+        pose_doorbell.close()
+        action_doorbell.close()
+        pose_reader.close()
+        action_events.close()
+        trace.close()
+        health.close()
 
 if __name__ == '__main__':
     main()
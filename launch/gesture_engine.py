@@ -0,0 +1,146 @@
+import collections
+import json
+
+# pattern elements that are not poses - where the pose history starts: detector start or the last published action
+START_MARKER = '<start>'
+ACTION_MARKER = '<action>'
+# printed in front of the poses of the history (kept from the old sequence strings, e.g. 'bb010')
+MARKER_TEXT = {START_MARKER: 'aa', ACTION_MARKER: 'bb'}
+
+Gesture = collections.namedtuple('Gesture', ['name', 'action', 'symbols', 'min_dwell', 'within'])
+
+class GestureEngine:
+	"""pose sequence -> gesture matcher compiled from a gesture table into an Aho-Corasick automaton
+
+	Every pose change advances the automaton by one table lookup. The automaton reports all gestures whose
+	pattern ends at the current pose, whatever their number and length; the first one (table order) whose
+	timing constraints hold against the bounded pose history is returned. A repeated pose leaves the automaton
+	where it is and only tells how long the current pose has been held - a gesture ending in a pose with a
+	min_dwell completes once that pose was held long enough. Markers are symbols of the stream too, so a
+	pattern starting with one matches only the poses right after it, and no pattern matches across one.
+	"""
+
+	def __init__(self, gestures, poses):
+		self.poses = dict(poses)
+		self.markers = [START_MARKER, ACTION_MARKER]
+		self.symbols = {code: i for i, code in enumerate(sorted(set(self.poses.values())))}
+		for marker in self.markers:
+			self.symbols[marker] = len(self.symbols)
+		# anything else (unknown pose code) breaks every pattern
+		self.other = len(self.symbols)
+		self.gestures = [self._compile(gesture) for gesture in gestures]
+		self._build()
+		self.history = collections.deque(maxlen=max([len(g.symbols) for g in self.gestures], default=1))
+		self.prev_pose = None
+		self._feed(START_MARKER, None)
+
+	@classmethod
+	def load(cls, path):
+		with open(path) as f:
+			config = json.load(f)
+		return cls(config['gestures'], config['poses'])
+
+	# pattern element - marker, pose name or pose code, alone or as {"pose": ..., "min_dwell": seconds}
+	def _symbol(self, element):
+		if isinstance(element, str) and element in self.markers:
+			return self.symbols[element]
+		code = self.poses.get(element, element)
+		if code not in self.symbols or isinstance(code, str):
+			raise ValueError(f"Unknown pose in gesture pattern: {element!r}")
+		return self.symbols[code]
+
+	def _compile(self, gesture):
+		symbols, dwell = [], []
+		for element in gesture['pattern']:
+			if isinstance(element, dict):
+				symbols.append(self._symbol(element['pose']))
+				dwell.append(element.get('min_dwell', gesture.get('min_dwell', 0.0)))
+			else:
+				symbols.append(self._symbol(element))
+				dwell.append(0.0 if element in self.markers else gesture.get('min_dwell', 0.0))
+		if not symbols:
+			raise ValueError(f"Empty gesture pattern: {gesture.get('name')}")
+		return Gesture(gesture.get('name', str(gesture['action'])), int(gesture['action']), symbols, dwell, gesture.get('within'))
+
+	# trie of all patterns + failure links folded into a full transition table, outputs merged along the links
+	def _build(self):
+		alphabet = self.other + 1
+		goto = [[-1] * alphabet]
+		outputs = [[]]
+		for g, gesture in enumerate(self.gestures):
+			state = 0
+			for symbol in gesture.symbols:
+				if goto[state][symbol] < 0:
+					goto[state][symbol] = len(goto)
+					goto.append([-1] * alphabet)
+					outputs.append([])
+				state = goto[state][symbol]
+			outputs[state].append(g)
+
+		fail = [0] * len(goto)
+		queue = collections.deque()
+		for symbol in range(alphabet):
+			if goto[0][symbol] < 0:
+				goto[0][symbol] = 0
+			else:
+				queue.append(goto[0][symbol])
+		while queue:
+			state = queue.popleft()
+			outputs[state] = sorted(set(outputs[state] + outputs[fail[state]]))
+			for symbol in range(alphabet):
+				child = goto[state][symbol]
+				if child < 0:
+					goto[state][symbol] = goto[fail[state]][symbol]
+				else:
+					fail[child] = goto[fail[state]][symbol]
+					queue.append(child)
+		self.delta = goto
+		self.outputs = outputs
+		self.state = 0
+
+	def _feed(self, element, timestamp):
+		symbol = self.symbols.get(element, self.other)
+		self.state = self.delta[self.state][symbol]
+		self.history.append((element, timestamp))
+
+	# dwell of every matched pose (time until the next one, the last one held until now) and span of the whole match
+	def _timing_ok(self, gesture, now):
+		entries = list(self.history)[-len(gesture.symbols):]
+		for (element, start), (_, end), min_dwell in zip(entries, entries[1:] + [(None, now)], gesture.min_dwell):
+			if min_dwell and start is not None and end is not None and end - start < min_dwell:
+				return False
+		if gesture.within is not None:
+			times = [t for element, t in entries if element not in self.markers]
+			if times[-1] - times[0] > gesture.within:
+				return False
+		return True
+
+	# next classified pose - returns the gesture completed by it, if any; a repeated pose can only complete a
+	# gesture waiting for its last pose to be held (min_dwell)
+	def push(self, pose, timestamp):
+		held = pose == self.prev_pose
+		if not held:
+			self.prev_pose = pose
+			self._feed(pose, timestamp)
+		for g in self.outputs[self.state]:
+			gesture = self.gestures[g]
+			if (not held or gesture.min_dwell[-1]) and self._timing_ok(gesture, timestamp):
+				return gesture
+		return None
+
+	# after a published action - history starts over, the pose held at that moment counts again
+	def reset(self):
+		self.prev_pose = None
+		self._feed(ACTION_MARKER, None)
+
+	# another person took over (new operator) - history starts over as at detector start
+	def restart(self):
+		self.prev_pose = None
+		self._feed(START_MARKER, None)
+
+	# poses since the last marker, e.g. 'bb010' (the last ones only, history is bounded by the longest pattern)
+	def sequence(self):
+		text = ''
+		for element, _ in self.history:
+			text = MARKER_TEXT[element] if element in MARKER_TEXT else text + str(element)
+		return text
@@ -0,0 +1,108 @@
+import time
+import numpy as np
+
+# traced pipeline stages - each one is recorded by exactly one process, so the histograms need no lock
+TRACE_STAGES = [
+	'grab',              # tracker: zed.grab() call
+	'preprocess',        # tracker: frame grabbed -> its rows published
+	'queue',             # classifier: newest frame of the window published -> window picked up
+	'classify',          # classifier: window picked up -> pose record written
+	'detect',            # detector: pose record written -> sequence step done
+	'command',           # spot controller: action published -> robot command issued
+	'frame_to_pose',     # grab of the newest frame of the window -> pose record written
+	'frame_to_command',  # grab of the newest frame of the window -> robot command issued
+]
+
+# log spaced bucket edges 0.1 ms .. 10 s, plus an underflow and an overflow bucket
+TRACE_EDGES_MS = np.geomspace(0.1, 10000, 51)
+TRACE_BUCKETS = len(TRACE_EDGES_MS) + 1
+
+# latency_trace layout - counts int64[stages, buckets], total int64[stages], sum_ms float64[stages], max_ms float64[stages]
+def latency_trace_size():
+	return 8 * len(TRACE_STAGES) * (TRACE_BUCKETS + 3)
+
+class LatencyTrace:
+	"""per-stage latency histograms in the latency_trace segment (recorded in ms)
+
+	Every stamp shared between the stages is time.perf_counter() - a system wide clock (QueryPerformanceCounter
+	on windows, CLOCK_MONOTONIC on linux) fine enough for the sub-ms stages; time.monotonic() ticks at 15.6 ms
+	on windows before python 3.13.
+	"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		stages = len(TRACE_STAGES)
+		self.counts = np.ndarray((stages, TRACE_BUCKETS), dtype=np.int64, buffer=shm.buf)
+		offset = 8 * stages * TRACE_BUCKETS
+		self.total = np.ndarray((stages,), dtype=np.int64, buffer=shm.buf, offset=offset)
+		offset += 8 * stages
+		self.sum_ms = np.ndarray((stages,), dtype=np.float64, buffer=shm.buf, offset=offset)
+		offset += 8 * stages
+		self.max_ms = np.ndarray((stages,), dtype=np.float64, buffer=shm.buf, offset=offset)
+		self.index = {stage: i for i, stage in enumerate(TRACE_STAGES)}
+
+	def record(self, stage, seconds):
+		i = self.index[stage]
+		ms = 1000.0 * seconds
+		self.counts[i, np.searchsorted(TRACE_EDGES_MS, ms, side='right')] += 1
+		self.total[i] += 1
+		self.sum_ms[i] += ms
+		if ms > self.max_ms[i]:
+			self.max_ms[i] = ms
+
+	# records end - start for a stage and returns end (now if not given), so spans can be chained
+	def span(self, stage, start, end=None):
+		end = time.perf_counter() if end is None else end
+		self.record(stage, end - start)
+		return end
+
+	# stage -> count, mean and p50/p95/p99/max in ms (percentiles are bucket upper edges, capped at max)
+	def summary(self):
+		out = {}
+		for stage, i in self.index.items():
+			n = int(self.total[i])
+			if n == 0:
+				continue
+			cumulative = np.cumsum(self.counts[i])
+			upper = np.append(TRACE_EDGES_MS, self.max_ms[i])
+			stats = {'count': n, 'mean_ms': float(self.sum_ms[i] / n)}
+			for q in (50, 95, 99):
+				bucket = min(int(np.searchsorted(cumulative, q / 100 * n)), TRACE_BUCKETS - 1)
+				stats[f'p{q}_ms'] = float(min(upper[bucket], self.max_ms[i]))
+			stats['max_ms'] = float(self.max_ms[i])
+			out[stage] = stats
+		return out
+
+	def reset(self):
+		self.counts[:] = 0
+		self.total[:] = 0
+		self.sum_ms[:] = 0
+		self.max_ms[:] = 0
+
+	def close(self):
+		del self.counts, self.total, self.sum_ms, self.max_ms
+		self.shm.close()
+
+class NullTrace:
+	"""stand-in used when the latency_trace segment does not exist - records nothing"""
+
+	def record(self, stage, seconds):
+		pass
+
+	def span(self, stage, start, end=None):
+		return time.perf_counter() if end is None else end
+
+	def summary(self):
+		return {}
+
+	def close(self):
+		pass
+
+def format_summary(summary):
+	lines = [f"{'stage':>18} {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)"]
+	for stage in TRACE_STAGES:
+		if stage in summary:
+			s = summary[stage]
+			lines.append(f"{stage:>18} {s['count']:>8} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+				f"{s['p99_ms']:>9.2f} {s['max_ms']:>9.2f}")
+	return '\n'.join(lines)
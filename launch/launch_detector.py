@@ -1,29 +1,122 @@
+import argparse
+import json
 import subprocess
 import time
 import signal
 import sys
 from pathlib import Path 
-from memory_management import memory_init, DETECTED_POSE_MEMORY_NAME
+from memory_management import memory_init, pipeline_memory_init, release_segments, attach_view, attach_latency_trace, format_backpressure, \
+    DETECTED_POSE_MEMORY_NAME, STAGE_HEALTH_MEMORY_NAME, PNN_INPUT_MEMORY_NAME, BACKPRESSURE_POLICIES, BACKPRESSURE_POLICY, \
+    OPERATOR_POLICIES, OPERATOR_POLICY, DISPLAY_MODES, DISPLAY_MODE
+from latency_trace import format_summary
+from supervisor import Supervisor, Stage, format_report, RESTART_POLICIES
 
 # Global variables to track processes
 processes = []
 
-# file direcotry creator function
-def assemble_dir(str_subfolder: str) -> str:
-    cwd = Path.cwd()
-    output_dir = str(cwd).replace("\\launch", str_subfolder)
-    print(output_dir)
-    return output_dir
+ROOT = Path(__file__).resolve().parent.parent
+
+# how often the supervisor checks exits, readiness and heartbeats (seconds)
+SUPERVISE_INTERVAL = 0.5
+
+# child command lines - absolute script paths, run by the same interpreter as the launcher
+def stage_commands(operator=OPERATOR_POLICY, display=DISPLAY_MODE):
+    return {
+        'tracker': [sys.executable, str(ROOT / 'body-tracker' / 'body_tracking.py'), '--operator', operator,
+                    '--display', display],
+        'classifier': [sys.executable, str(ROOT / 'pose-classifier' / 'pnn.py'), DETECTED_POSE_MEMORY_NAME],
+        'detector': [sys.executable, str(ROOT / 'launch' / 'detect_human_action.py'), DETECTED_POSE_MEMORY_NAME],
+    }
+
+# consumers are started (and ready) before their producers, so no frame or pose code is published into the void
+def supervised_stages(restart, operator=OPERATOR_POLICY, display=DISPLAY_MODE):
+    commands = stage_commands(operator, display)
+    return [
+        Stage('detector', commands['detector'], restart=restart),
+        Stage('classifier', commands['classifier'], depends=['detector'], restart=restart),
+        Stage('tracker', commands['tracker'], depends=['classifier'], restart=restart),
+    ]
+
+# per-stage latency histograms collected by all modules and tracker -> classifier frame counters
+# (printed, optionally written as json)
+def dump_trace(trace, json_path=None, pnn_input=None):
+    summary = trace.summary()
+    print("[Launcher]: latency trace")
+    print(format_summary(summary))
+    if pnn_input is not None:
+        summary['frames'] = pnn_input.stats()
+        print(f"[Launcher]: {format_backpressure(summary['frames'])}")
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+# single process mode - one interpreter, one loaded model, in-memory queues between the stages
+def in_process_main(args, classifier_args):
+    # tracker / classifier modules are loaded into the launcher only in this mode
+    from pipeline import run_pipeline
+
+    try:
+        shms = pipeline_memory_init()
+    except RuntimeError as e:
+        print(f"[Launcher]: {e}")
+        sys.exit(1)
+    trace = attach_latency_trace()
+    try:
+        status = run_pipeline(classifier_args, trace, args.backpressure, args.operator, args.display)
+    finally:
+        dump_trace(trace, args.trace_json)
+        trace.close()
+        release_segments(shms)
+    sys.exit(status)
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trace-interval', type=float, default=0, help='print latency trace every N seconds (0 - only at shutdown)')
+    parser.add_argument('--trace-json', default=None, help='also write latency trace summary to this json file')
+    parser.add_argument('--supervise', action='store_true', help='start stages in order, wait for readiness, restart crashed or hung stages')
+    parser.add_argument('--restart', choices=RESTART_POLICIES, default='on-failure', help='restart policy of supervised stages')
+    parser.add_argument('--backpressure', choices=BACKPRESSURE_POLICIES, default=BACKPRESSURE_POLICY,
+                        help='what happens to frames when the classifier falls behind the tracker')
+    parser.add_argument('--operator', choices=OPERATOR_POLICIES, default=OPERATOR_POLICY,
+                        help='which of the people in view drives the actions (each one is classified)')
+    parser.add_argument('--display', choices=DISPLAY_MODES, default=DISPLAY_MODE,
+                        help="tracker camera window - 'none' runs headless (no image retrieval, no rendering)")
+    parser.add_argument('--report-interval', type=float, default=0, help='print per stage cpu / memory every N seconds when supervising (0 - never)')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run tracker, classifier and detector as threads of this process (takes pnn.py model options too)')
+    args, classifier_args = parser.parse_known_args()
+    if classifier_args and not args.in_process:
+        parser.error(f"unrecognized arguments: {' '.join(classifier_args)}")
+    if args.in_process and args.supervise:
+        parser.error("--in-process and --supervise are exclusive")
+
+    if args.in_process:
+        in_process_main(args, classifier_args)
+        return
+
     # Init memory segments for communication
     shms = []
-    shms = memory_init()
+    try:
+        shms = memory_init()
+    except RuntimeError as e:
+        print(f"[Launcher]: {e}")
+        sys.exit(1)
+    trace = attach_latency_trace()
+    pnn_input = attach_view(PNN_INPUT_MEMORY_NAME)
+    pnn_input.set_policy(args.backpressure)
+    supervisor = None
+    if args.supervise:
+        health = attach_view(STAGE_HEALTH_MEMORY_NAME)
+        supervisor = Supervisor(supervised_stages(args.restart, args.operator, args.display), health)
 
     # signal handler function
     def signal_handler(sig, frame):
         """Handle interrupt signals by terminating child processes"""
         print("\nShutting down processes...")
+        if supervisor is not None:
+            supervisor.stop()
+            print(format_report(supervisor.report()))
+            supervisor.health.close()
         for process in processes:
             if process.poll() is None:  # Check if process is still running
                 print(f"Terminating process with PID: {process.pid}")
@@ -35,12 +128,13 @@ def main():
                     print(f"Process {process.pid} did not terminate gracefully, killing...")
                     process.kill()
             
+        dump_trace(trace, args.trace_json, pnn_input)
+        trace.close()
+        pnn_input.close()
+
         # handle connections
         try:
-            for shm in shms:
-                print(f"[Launcher]: Cleaning up memeory segment {shm}")
-                shm.close()
-                shm.unlink()
+            release_segments(shms)
 
         except Exception as e:
             print(f"Error: {e}. Did not correclty unlinked shared memory. Possible memory leakage")
@@ -53,27 +147,47 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)  # Termination signal
 
     try:
+        if supervisor is not None:
+            # stages come up one by one, each waiting for the previous to report ready
+            supervisor.start()
+            print("All stages ready. Press Ctrl+C to quit.")
+            last_report = last_trace = time.monotonic()
+            while supervisor.alive():
+                supervisor.poll()
+                now = time.monotonic()
+                if args.report_interval > 0 and now - last_report >= args.report_interval:
+                    print(format_report(supervisor.report()))
+                    last_report = now
+                if args.trace_interval > 0 and now - last_trace >= args.trace_interval:
+                    dump_trace(trace, args.trace_json, pnn_input)
+                    last_trace = now
+                time.sleep(SUPERVISE_INTERVAL)
+            # every stage stopped for good (clean exits or restart policy gave up)
+            signal_handler(None, None)
+
+        commands = stage_commands(args.operator, args.display)
+
         # Launch camera
         print("Launching body tracking...")
-        tracker_dir = assemble_dir(str_subfolder="\\body-tracker\\body_tracking.py")
-        p1 = subprocess.Popen(["python",tracker_dir])
+        p1 = subprocess.Popen(commands['tracker'])
         processes.append(p1)
 
         # Launch pose classifier
         print("Launching predictor...")
-        classifier_dir = assemble_dir(str_subfolder="\\pose-classifier\\pnn.py")
-        p2 = subprocess.Popen(["python", classifier_dir, DETECTED_POSE_MEMORY_NAME])
+        p2 = subprocess.Popen(commands['classifier'])
         processes.append(p2)
 
         # Launch action detector
         print("Launching action detector...")
-        detector_dir = assemble_dir(str_subfolder="\\launch\\detect_human_Action.py")
-        p3 = subprocess.Popen(["python", detector_dir, DETECTED_POSE_MEMORY_NAME])
+        p3 = subprocess.Popen(commands['detector'])
         processes.append(p3)
 
         print("All processes started. Press Ctrl+C to quit.")
         
-        # Wait for processes to complete
+        # Wait for processes to complete (dumping the latency trace meanwhile if asked to)
+        while args.trace_interval > 0 and any(process.poll() is None for process in processes):
+            time.sleep(args.trace_interval)
+            dump_trace(trace, args.trace_json, pnn_input)
         p1.wait()
         p2.wait()
         p3.wait()
@@ -1,22 +1,646 @@
-from multiprocessing import shared_memory
+import collections
+import select
+import socket
+import time
 import numpy as np
+from latency_trace import LatencyTrace, NullTrace, latency_trace_size
+from stage_health import StageHealth, HealthReporter, NullHealth, stage_health_size
+from segment_registry import Segment, attach_segment, remove_segment, claim_registry, create_segments, existing_segments
 
 DETECTED_POSE_MEMORY_NAME = "detected_pose_code_shm"
 DETECTED_SEQ_MEMORY_NAME = "detected_seq_code_shm"
 PNN_INPUT_MEMORY_NAME = "pnn_input"
+ACTION_EVENTS_MEMORY_NAME = "action_events"
+LATENCY_TRACE_MEMORY_NAME = "latency_trace"
+STAGE_HEALTH_MEMORY_NAME = "stage_health"
+PERSON_POSES_MEMORY_NAME = "person_poses"
 
-def init_memory_segment(name, size):
-	return shared_memory.SharedMemory(create=True, size=size, name=name)
+# pnn_input ring - preprocessed frames (a row of 19 keypoints x 3) from the tracker to the classifier, which builds
+# the windows of every person out of them (128 frames - about 4 s of one person at 30 fps)
+PNN_INPUT_SLOTS = 128
+PNN_INPUT_COLS = 57
+# frames of one person classified together (back to back windows, without --stream)
+PNN_WINDOW = 15
 
-def memory_init():
-	return [
-		init_memory_segment(name=DETECTED_POSE_MEMORY_NAME, size=8)
-    ]    
+# ZED tracking ids of the people in view - windows of a producer that does not track bodies belong to DEFAULT_BODY,
+# which is also the operator until the tracker names one (NO_BODY: nobody in view)
+DEFAULT_BODY = 0
+NO_BODY = -1
 
-def make_cleanup_handler(shm):
-    def cleanup(signum=None, frame=None):
-        print("[Predictor Module]: cleaning up shared memory...")
-        shm.close()
-        exit(0)
-    return cleanup
+# how the tracker picks the operator among the people in view - closest to the camera, largest in the image,
+# or tracked the longest
+OPERATOR_POLICIES = ('closest', 'largest', 'longest')
+OPERATOR_POLICY = 'closest'
 
+# tracker display - 'window': camera image with the poses, rendered by its own thread; 'none': headless
+DISPLAY_MODES = ('window', 'none')
+DISPLAY_MODE = 'window'
+
+# detected pose record - class id stays the first 8 bytes, so readers of the old raw pose code keep working
+POSE_CLASSES = 4
+POSE_RECORD_DTYPE = np.dtype([
+	('class_id', np.int64),
+	('seq', np.int64),          # seqlock version - odd while the classifier is writing
+	('window_id', np.int64),    # pnn_input sequence number of the classified window
+	('timestamp', np.float64),  # time.perf_counter() of the write
+	('scores', np.float64, (POSE_CLASSES,)),
+	('origin', np.float64),     # camera grab time of the window (trace origin)
+	('body_id', np.int64),      # tracked person the window belongs to (the operator)
+])
+
+# latest pose of every tracked person - one seqlock record per person, slots reused by the classifier
+# for new people once every slot is taken (the one classified longest ago goes)
+PERSON_SLOTS = 6
+PERSON_POSE_DTYPE = np.dtype([
+	('seq', np.int64),          # seqlock version - odd while the classifier is writing
+	('body_id', np.int64),
+	('class_id', np.int64),
+	('window_id', np.int64),
+	('timestamp', np.float64),
+	('scores', np.float64, (POSE_CLASSES,)),
+	('origin', np.float64),
+])
+
+# action events - queue of detected actions from the detector to the spot controller
+ACTION_EVENT_SLOTS = 16
+ACTION_EVENT_DTYPE = np.dtype([
+	('seq', np.int64),          # 0 while the slot is being written
+	('action_id', np.int64),
+	('timestamp', np.float64),  # time.perf_counter() of the detection
+	('sequence', 'S32'),        # pose sequence that triggered the action (last 32 codes)
+	('trace_id', np.int64),     # window id of the pose record that completed the sequence
+	('origin', np.float64),     # camera grab time of that window
+])
+ACTION_EVENTS_HEADER = 3
+
+# doorbells - localhost UDP port per channel, a consumer blocks on it until the producer publishes something new
+ACTION_CODE_CHANNEL = "action_code"
+DOORBELL_HOST = "127.0.0.1"
+DOORBELL_PORTS = {
+	PNN_INPUT_MEMORY_NAME: 47110,
+	DETECTED_POSE_MEMORY_NAME: 47111,
+	ACTION_CODE_CHANNEL: 47112,
+}
+# consumers re-check their source at least this often even if a datagram got lost
+DOORBELL_TIMEOUT = 0.5
+
+# frame ring layout (single producer, single consumer, lock free):
+#   header    int64[11]           - see RING_* below
+#   slot_seq  int64[slots]        - sequence number held by the slot (0 while being written)
+#   slot_time float64[slots]      - time.perf_counter() of the write
+#   slot_origin float64[slots]    - camera grab time of the frame (latency trace origin)
+#   slot_body int64[slots]        - tracked person the frame belongs to
+#   slot_frame int64[slots]       - tracker frame number - consecutive frames of a person have consecutive numbers
+#   rows      float32[slots, cols]
+# the writer invalidates a slot, fills it, stamps its sequence and only then bumps the published count;
+# a reader accepts a slot only if its sequence is the expected one before and after copying (no torn reads)
+FRAME_RING_HEADER = 11
+RING_PUBLISHED = 0  # frames accepted into the ring (sequence number of the newest one) - writer
+RING_SLOTS = 1
+RING_COLS = 2
+RING_POLICY = 3     # index into BACKPRESSURE_POLICIES - set by the launcher
+RING_CURSOR = 4     # sequence number of the last frame taken out of the ring - reader
+RING_CONSUMED = 5   # frames handed to the classifier as new frames of a window - reader
+RING_SKIPPED = 6    # frames overwritten before the reader got to them, or dropped before they made it into a window - reader
+RING_REJECTED = 7   # frames refused because the ring was full (drop-newest) - writer
+RING_OPERATOR = 8   # body id of the person whose poses drive actions - writer
+RING_INVALID = 9    # frames not published, keypoints missing even after gap filling - writer
+RING_REPAIRED = 10  # frames published with missing keypoints filled in - writer
+
+# what happens when the tracker publishes faster than the classifier consumes:
+#   latest-only - the classifier takes every published frame before it builds a window, so the window of a person is
+#                 always its newest frames; frames sliding out of a window before it is classified are skipped
+#   drop-oldest - windows are built from the frames in order, the tracker overwrites the oldest unread frame when the ring is full
+#   drop-newest - windows are built from the frames in order, the tracker drops its new frame while the ring is full
+BACKPRESSURE_POLICIES = ('latest-only', 'drop-oldest', 'drop-newest')
+BACKPRESSURE_POLICY = 'latest-only'
+
+def frame_ring_size(slots, cols):
+	return 8 * (FRAME_RING_HEADER + 5 * slots) + 4 * slots * cols
+
+def init_frame_ring(shm, slots, cols, policy=BACKPRESSURE_POLICY):
+	header = np.ndarray((FRAME_RING_HEADER,), dtype=np.int64, buffer=shm.buf)
+	header[:] = 0
+	header[RING_SLOTS], header[RING_COLS] = slots, cols
+	header[RING_POLICY] = BACKPRESSURE_POLICIES.index(policy)
+	header[RING_OPERATOR] = DEFAULT_BODY
+
+# frame copied out of the frame ring (frame - tracker frame number)
+Frame = collections.namedtuple('Frame', ['seq', 'timestamp', 'origin', 'row', 'body_id', 'frame'])
+
+# window of one person built by the classifier - seq, timestamp and origin are those of its newest frame (seq doubles
+# as the trace id of everything derived from it); new - frames not in an earlier window of the person,
+# restart - the person's first window after a break in its frames
+Window = collections.namedtuple('Window', ['seq', 'timestamp', 'origin', 'frames', 'body_id', 'new', 'restart'])
+
+class FrameRing:
+	"""numpy views onto a frame ring segment (geometry read from its header)"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		self.header = np.ndarray((FRAME_RING_HEADER,), dtype=np.int64, buffer=shm.buf)
+		self.slots, cols = int(self.header[RING_SLOTS]), int(self.header[RING_COLS])
+		offset = 8 * FRAME_RING_HEADER
+		self.slot_seq = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+		offset += 8 * self.slots
+		self.slot_time = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+		offset += 8 * self.slots
+		self.slot_origin = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+		offset += 8 * self.slots
+		self.slot_body = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+		offset += 8 * self.slots
+		self.slot_frame = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+		offset += 8 * self.slots
+		self.rows = np.ndarray((self.slots, cols), dtype=np.float32, buffer=shm.buf, offset=offset)
+
+	# number of frames published so far (sequence number of the newest one)
+	@property
+	def published(self):
+		return int(self.header[RING_PUBLISHED])
+
+	@property
+	def policy(self):
+		return BACKPRESSURE_POLICIES[int(self.header[RING_POLICY])]
+
+	def set_policy(self, policy):
+		self.header[RING_POLICY] = BACKPRESSURE_POLICIES.index(policy)
+
+	@property
+	def operator(self):
+		return int(self.header[RING_OPERATOR])
+
+	def set_operator(self, body_id):
+		self.header[RING_OPERATOR] = body_id
+
+	# frames - produced = published + rejected, dropped = skipped + rejected, queued = published but neither handed to
+	# the classifier nor dropped yet (in the ring or in an unfinished window); invalid frames are not produced
+	def stats(self):
+		published, consumed, skipped, rejected, invalid, repaired = (int(self.header[i]) for i in
+			(RING_PUBLISHED, RING_CONSUMED, RING_SKIPPED, RING_REJECTED, RING_INVALID, RING_REPAIRED))
+		return {'policy': self.policy, 'produced': published + rejected, 'consumed': consumed,
+			'dropped': skipped + rejected, 'skipped': skipped, 'rejected': rejected, 'queued': max(0, published - consumed - skipped),
+			'invalid': invalid, 'repaired': repaired}
+
+	def close(self):
+		# views must go before the segment can be closed
+		del self.header, self.slot_seq, self.slot_time, self.slot_origin, self.slot_body, self.slot_frame, self.rows
+		self.shm.close()
+
+class FrameRingWriter(FrameRing):
+
+	# copies one frame (row) into the next slot and publishes it - returns its sequence number, 0 if the policy dropped it;
+	# frame - tracker frame number (the sequence number if not given), repaired - some of its keypoints were filled in
+	def write(self, row, timestamp=None, origin=None, body_id=DEFAULT_BODY, frame=None, repaired=False):
+		if repaired:
+			self.header[RING_REPAIRED] += 1
+		seq = self.published + 1
+		if self.header[RING_POLICY] == BACKPRESSURE_POLICIES.index('drop-newest') and seq - self.header[RING_CURSOR] > self.slots:
+			self.header[RING_REJECTED] += 1
+			return 0
+		slot = (seq - 1) % self.slots
+		self.slot_seq[slot] = 0
+		self.rows[slot] = row
+		self.slot_time[slot] = time.perf_counter() if timestamp is None else timestamp
+		self.slot_origin[slot] = self.slot_time[slot] if origin is None else origin
+		self.slot_body[slot] = body_id
+		self.slot_frame[slot] = seq if frame is None else frame
+		self.slot_seq[slot] = seq
+		self.header[RING_PUBLISHED] = seq
+		return seq
+
+	# frames the tracker did not publish - too many keypoints missing
+	def discard(self, frames=1):
+		self.header[RING_INVALID] += frames
+
+class FrameRingReader(FrameRing):
+
+	def __init__(self, shm):
+		super().__init__(shm)
+		# a (re)started classifier begins with what is published from now on - frames published before it and the
+		# unfinished windows of a previous classifier are dropped
+		self.last_seq = self.published
+		self.header[RING_CURSOR] = self.last_seq
+		self.header[RING_SKIPPED] = self.last_seq - self.header[RING_CONSUMED]
+
+	# copy of frame seq, None when it was overwritten or is being written
+	def read(self, seq):
+		slot = (seq - 1) % self.slots
+		if self.slot_seq[slot] != seq:
+			return None
+		row = self.rows[slot].copy()
+		timestamp = float(self.slot_time[slot])
+		origin = float(self.slot_origin[slot])
+		body_id = int(self.slot_body[slot])
+		frame = int(self.slot_frame[slot])
+		if self.slot_seq[slot] != seq:
+			return None
+		return Frame(seq, timestamp, origin, row, body_id, frame)
+
+	# next frame in publication order (the oldest one still in the ring) - Frame or None
+	def read_next(self):
+		for _ in range(self.slots):
+			published = self.published
+			if published <= self.last_seq:
+				return None
+			seq = max(self.last_seq + 1, published - self.slots + 1)
+			frame = self.read(seq)
+			# frames overwritten before the reader got to them (or while copying) are passed over
+			self.account(skipped=seq - self.last_seq - (frame is not None))
+			self.last_seq = seq
+			self.header[RING_CURSOR] = seq
+			if frame is not None:
+				return frame
+		return None
+
+	# frames handed to the classifier / dropped on the way (see WindowAssembler)
+	def account(self, consumed=0, skipped=0):
+		self.header[RING_CONSUMED] += consumed
+		self.header[RING_SKIPPED] += skipped
+
+class PersonFrames:
+	"""consecutive frames of one person taken by the classifier - the last `window` of them"""
+
+	def __init__(self, window):
+		self.rows = collections.deque(maxlen=window)
+		self.newest = None
+		self.new = 0
+		self.restart = True
+
+class WindowAssembler:
+	"""classifier side of pnn_input - builds the windows of every person out of the frames of a frame source
+	(FrameRingReader, or FrameQueue of the in-process pipeline) by its backpressure policy
+
+	A window is the last `window` consecutive frames of a person; it is ready once `stride` frames of the person came
+	in since its previous window (stride == window: back to back windows, stride 1: a window per frame). A frame that
+	does not follow the previous one of its person (the tracker lost the person, frames were invalid or dropped)
+	starts the person's frames over, so a window never splices frames from both sides of a gap.
+	"""
+
+	def __init__(self, source, window, stride=None, persons=PERSON_SLOTS):
+		self.source = source
+		self.window = window
+		self.stride = window if stride is None else stride
+		self.size = persons
+		# body id -> PersonFrames, the person that sent a frame longest ago makes room for a new one
+		self.persons = collections.OrderedDict()
+		# body ids with a window ready, in the order they got ready
+		self.ready = collections.OrderedDict()
+
+	def _forget(self, body_id):
+		person = self.persons.pop(body_id)
+		self.ready.pop(body_id, None)
+		self.source.account(skipped=person.new)
+
+	def _add(self, frame):
+		person = self.persons.get(frame.body_id)
+		if person is not None and frame.frame != person.newest.frame + 1:
+			self._forget(frame.body_id)
+			person = None
+		if person is None:
+			person = self.persons[frame.body_id] = PersonFrames(self.window)
+			if len(self.persons) > self.size:
+				self._forget(next(iter(self.persons)))
+		self.persons.move_to_end(frame.body_id)
+		person.rows.append(frame.row)
+		person.newest = frame
+		person.new += 1
+		if person.new > self.window:
+			# slid out of the window before the classifier took it (latest-only)
+			person.new -= 1
+			self.source.account(skipped=1)
+		if person.new >= self.stride:
+			self.ready.setdefault(frame.body_id, True)
+
+	# next ready window (the person whose window got ready first), None when no window is ready
+	def read_next(self):
+		latest = self.source.policy == 'latest-only'
+		while latest or not self.ready:
+			frame = self.source.read_next()
+			if frame is None:
+				break
+			self._add(frame)
+		if not self.ready:
+			return None
+		body_id, _ = self.ready.popitem(last=False)
+		person = self.persons[body_id]
+		newest = person.newest
+		window = Window(newest.seq, newest.timestamp, newest.origin, np.array(person.rows), body_id, person.new, person.restart)
+		self.source.account(consumed=person.new)
+		person.new = 0
+		person.restart = False
+		return window
+
+def format_backpressure(stats):
+	return (f"[{stats['policy']}] frames produced {stats['produced']}, consumed {stats['consumed']}, dropped {stats['dropped']} "
+		f"(skipped {stats['skipped']}, rejected {stats['rejected']}), queued {stats['queued']}; "
+		f"invalid {stats['invalid']}, repaired {stats['repaired']}")
+
+# latency histograms - NullTrace when the segment does not exist (stage started without the launcher)
+def attach_latency_trace():
+	try:
+		return attach_view(LATENCY_TRACE_MEMORY_NAME)
+	except FileNotFoundError:
+		return NullTrace()
+
+# readiness / heartbeat slot of a supervised stage - NullHealth when started without the launcher
+def attach_stage_health(stage):
+	try:
+		return HealthReporter(attach_segment(STAGE_HEALTH_MEMORY_NAME, SEGMENTS[STAGE_HEALTH_MEMORY_NAME].size), stage)
+	except FileNotFoundError:
+		return NullHealth()
+
+# consistent copy of the pose record - seq counts published records (0 = nothing classified yet)
+PoseRecord = collections.namedtuple('PoseRecord', ['seq', 'timestamp', 'class_id', 'scores', 'window_id', 'origin', 'body_id'],
+	defaults=(DEFAULT_BODY,))
+
+# seqlock over one record with a 'seq' version field - version goes odd, fields are filled, version goes even;
+# returns the number of writes made to the record
+def seqlock_write(record, **fields):
+	version = int(record['seq'])
+	record['seq'] = version + 1
+	for name, value in fields.items():
+		record[name] = value
+	record['seq'] = version + 2
+	return (version + 2) // 2
+
+# copy of the record taken between two equal even versions, None if every attempt overlapped a write
+def seqlock_read(record, attempts=100):
+	for _ in range(attempts):
+		version = int(record['seq'])
+		if version % 2:
+			continue
+		snapshot = record.copy()
+		if int(record['seq']) == version:
+			return snapshot
+	return None
+
+def pose_record(snapshot):
+	return PoseRecord(int(snapshot['seq']) // 2, float(snapshot['timestamp']), int(snapshot['class_id']),
+		snapshot['scores'].copy(), int(snapshot['window_id']), float(snapshot['origin']), int(snapshot['body_id']))
+
+class PoseSlot:
+	"""numpy view onto the detected pose record segment"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		self.record = np.ndarray((), dtype=POSE_RECORD_DTYPE, buffer=shm.buf)
+
+	def close(self):
+		del self.record
+		self.shm.close()
+
+class PoseRecordWriter(PoseSlot):
+
+	def __init__(self, shm):
+		super().__init__(shm)
+		# a previous classifier killed mid-write leaves the version odd - close that write off
+		if int(self.record['seq']) % 2:
+			self.record['seq'] += 1
+
+	# returns the record seq
+	def write(self, class_id, scores, window_id=0, timestamp=None, origin=None, body_id=DEFAULT_BODY):
+		timestamp = time.perf_counter() if timestamp is None else timestamp
+		return seqlock_write(self.record, class_id=class_id, window_id=window_id, scores=scores, timestamp=timestamp,
+			origin=timestamp if origin is None else origin, body_id=body_id)
+
+class PoseRecordReader(PoseSlot):
+
+	def __init__(self, shm):
+		super().__init__(shm)
+		self.last_seq = 0
+		self.missed = 0
+
+	# PoseRecord copied between two equal even versions, None if every attempt overlapped a write
+	def read(self, attempts=100):
+		snapshot = seqlock_read(self.record, attempts)
+		return None if snapshot is None else pose_record(snapshot)
+
+	# record published since the previous call (None if there is none) - repeated poses come back as new records
+	def read_new(self):
+		record = self.read()
+		if record is None or record.seq <= self.last_seq:
+			return None
+		if self.last_seq:
+			self.missed += record.seq - self.last_seq - 1
+		self.last_seq = record.seq
+		return record
+
+class PersonPoses:
+	"""numpy view onto the per person pose table segment"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		self.table = np.ndarray((PERSON_SLOTS,), dtype=PERSON_POSE_DTYPE, buffer=shm.buf)
+
+	# 0-d view of one slot - the record its seqlock works on
+	def record(self, slot):
+		return self.table[slot:slot + 1].reshape(())
+
+	def close(self):
+		del self.table
+		self.shm.close()
+
+class PersonPoseWriter(PersonPoses):
+
+	def __init__(self, shm):
+		super().__init__(shm)
+		# slots a previous classifier was killed writing - close those writes off
+		self.table['seq'] += self.table['seq'] % 2
+
+	# the person's own slot, else the one classified longest ago (never written ones first)
+	def slot(self, body_id):
+		own = np.flatnonzero((self.table['body_id'] == body_id) & (self.table['seq'] > 0))
+		if own.size:
+			return int(own[0])
+		return int(np.argmin(np.where(self.table['seq'] > 0, self.table['timestamp'], -np.inf)))
+
+	def write(self, body_id, class_id, scores, window_id=0, timestamp=None, origin=None):
+		timestamp = time.perf_counter() if timestamp is None else timestamp
+		return seqlock_write(self.record(self.slot(body_id)), body_id=body_id, class_id=class_id, window_id=window_id,
+			scores=scores, timestamp=timestamp, origin=timestamp if origin is None else origin)
+
+class PersonPoseReader(PersonPoses):
+
+	# body id -> latest PoseRecord of every person classified within max_age seconds (all of them if None);
+	# seq counts the writes to the person's slot
+	def read_all(self, max_age=None):
+		now = time.perf_counter()
+		poses = {}
+		for slot in range(PERSON_SLOTS):
+			snapshot = seqlock_read(self.record(slot))
+			if snapshot is None or snapshot['seq'] == 0 or (max_age is not None and now - snapshot['timestamp'] > max_age):
+				continue
+			poses[int(snapshot['body_id'])] = pose_record(snapshot)
+		return poses
+
+# action event queue layout - header int64[3] (published count, slots, creation time in ns) + ACTION_EVENT_DTYPE[slots]
+# same publication order as the frame ring: slot invalidated, filled, stamped with its seq, count bumped
+# the creation time tells the queue of one launcher run from the next one (readers outlive launchers)
+def action_events_size(slots):
+	return 8 * ACTION_EVENTS_HEADER + slots * ACTION_EVENT_DTYPE.itemsize
+
+def init_action_events(shm, slots):
+	header = np.ndarray((ACTION_EVENTS_HEADER,), dtype=np.int64, buffer=shm.buf)
+	header[:] = [0, slots, time.time_ns()]
+
+ActionEvent = collections.namedtuple('ActionEvent', ['seq', 'action_id', 'timestamp', 'sequence', 'trace_id', 'origin'])
+
+class ActionEvents:
+	"""numpy views onto the action event queue segment"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		self.header = np.ndarray((ACTION_EVENTS_HEADER,), dtype=np.int64, buffer=shm.buf)
+		self.slots = int(self.header[1])
+		self.events = np.ndarray((self.slots,), dtype=ACTION_EVENT_DTYPE, buffer=shm.buf, offset=8 * ACTION_EVENTS_HEADER)
+
+	@property
+	def published(self):
+		return int(self.header[0])
+
+	@property
+	def created(self):
+		return int(self.header[2])
+
+	def close(self):
+		del self.header, self.events
+		self.shm.close()
+
+class ActionEventWriter(ActionEvents):
+
+	def publish(self, action_id, sequence='', timestamp=None, trace_id=0, origin=None):
+		seq = self.published + 1
+		slot = (seq - 1) % self.slots
+		self.events['seq'][slot] = 0
+		self.events['action_id'][slot] = action_id
+		self.events['timestamp'][slot] = time.perf_counter() if timestamp is None else timestamp
+		self.events['sequence'][slot] = sequence[-32:].encode('ascii', 'replace')
+		self.events['trace_id'][slot] = trace_id
+		self.events['origin'][slot] = self.events['timestamp'][slot] if origin is None else origin
+		self.events['seq'][slot] = seq
+		self.header[0] = seq
+		return seq
+
+class ActionEventReader(ActionEvents):
+
+	def __init__(self, shm):
+		super().__init__(shm)
+		self.last_seq = self.published
+		self.incarnation = self.created
+		self.missed = 0
+
+	# events already in the queue count as new too (queue of a launcher started after the reader)
+	def rewind(self):
+		self.last_seq = 0
+
+	# every event published since the previous call, oldest first (events overwritten in between are counted as missed)
+	# a queue initialised again in place (launcher restarted, segment reused) is read from its first event
+	def read_new(self):
+		published = self.published
+		if self.created != self.incarnation or published < self.last_seq:
+			self.incarnation = self.created
+			self.last_seq = 0
+		first = max(self.last_seq + 1, published - self.slots + 1)
+		self.missed += first - self.last_seq - 1
+		events = []
+		for seq in range(first, published + 1):
+			slot = (seq - 1) % self.slots
+			record = self.events[slot].copy()
+			if record['seq'] != seq or self.events['seq'][slot] != seq:
+				# lapped by the writer while copying
+				self.missed += 1
+				continue
+			events.append(ActionEvent(seq, int(record['action_id']), float(record['timestamp']), record['sequence'].decode('ascii'),
+				int(record['trace_id']), float(record['origin'])))
+		self.last_seq = published
+		return events
+
+class Doorbell:
+	"""consumer side of a channel - wait() sleeps in select() until the producer rings (or timeout)
+
+	The doorbell only says "look again": consumers still read the sequence counter / value they
+	were reading before, so a datagram rung between their check and wait() just makes wait() return at once.
+	"""
+
+	def __init__(self, channel):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind((DOORBELL_HOST, DOORBELL_PORTS[channel]))
+		self.sock.setblocking(False)
+
+	# True when rung, False on timeout - pending rings are drained so one wait covers them all
+	def wait(self, timeout=DOORBELL_TIMEOUT):
+		ready, _, _ = select.select([self.sock], [], [], timeout)
+		if not ready:
+			return False
+		try:
+			while True:
+				self.sock.recv(16)
+		except (BlockingIOError, ConnectionResetError):
+			pass
+		return True
+
+	def close(self):
+		self.sock.close()
+
+class DoorbellRinger:
+	"""producer side of a channel - ring() never blocks and never fails if nobody listens"""
+
+	def __init__(self, channel):
+		self.address = (DOORBELL_HOST, DOORBELL_PORTS[channel])
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.setblocking(False)
+
+	def ring(self):
+		try:
+			self.sock.sendto(b'\x01', self.address)
+		except OSError:
+			pass
+
+	def close(self):
+		self.sock.close()
+
+# every shared segment of the pipeline - created and removed by the launcher, attached by the stages
+SEGMENTS = {segment.name: segment for segment in [
+	Segment(DETECTED_POSE_MEMORY_NAME, POSE_RECORD_DTYPE.itemsize, PoseSlot, owner='classifier'),
+	Segment(PERSON_POSES_MEMORY_NAME, PERSON_SLOTS * PERSON_POSE_DTYPE.itemsize, PersonPoses, owner='classifier'),
+	Segment(PNN_INPUT_MEMORY_NAME, frame_ring_size(PNN_INPUT_SLOTS, PNN_INPUT_COLS), FrameRing, owner='tracker',
+		init=lambda shm: init_frame_ring(shm, PNN_INPUT_SLOTS, PNN_INPUT_COLS)),
+	Segment(ACTION_EVENTS_MEMORY_NAME, action_events_size(ACTION_EVENT_SLOTS), ActionEvents, owner='detector',
+		init=lambda shm: init_action_events(shm, ACTION_EVENT_SLOTS)),
+	Segment(LATENCY_TRACE_MEMORY_NAME, latency_trace_size(), LatencyTrace, owner='every stage'),
+	Segment(STAGE_HEALTH_MEMORY_NAME, stage_health_size(), StageHealth, owner='every stage'),
+]}
+
+# in-process pipeline - stages talk through in-memory queues, only the action queue (read by the spot controller)
+# and the latency trace are shared
+PIPELINE_SEGMENTS = [ACTION_EVENTS_MEMORY_NAME, LATENCY_TRACE_MEMORY_NAME]
+
+# launcher side - claims the registry and creates the declared segments (leftovers of a crashed run are reclaimed)
+def memory_init(names=None):
+	registry = claim_registry()
+	try:
+		shms = create_segments([SEGMENTS[name] for name in (names or SEGMENTS)])
+	except Exception:
+		remove_segment(registry)
+		raise
+	return shms + [registry]
+
+def pipeline_memory_init():
+	return memory_init(PIPELINE_SEGMENTS)
+
+# launcher side - removes the segments created by memory_init and reports any declared segment still left
+def release_segments(shms):
+	for shm in shms:
+		print(f"[Launcher]: Cleaning up memory segment {shm.name}")
+		remove_segment(shm)
+	leaked = existing_segments(SEGMENTS.values())
+	if leaked:
+		print(f"[Launcher]: segments still present after cleanup: {', '.join(leaked)}")
+
+# stage side - typed view of a declared segment; layout must be the declared view class or one of its subclasses
+def attach_view(name, layout=None):
+	segment = SEGMENTS[name]
+	layout = layout or segment.layout
+	if not issubclass(layout, segment.layout):
+		raise TypeError(f"{layout.__name__} is not a view of segment {name} ({segment.layout.__name__})")
+	return layout(attach_segment(name, segment.size))
@@ -0,0 +1,210 @@
+import argparse
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import numpy as np
+from memory_management import Frame, PoseRecord, ActionEventWriter, DoorbellRinger, attach_view, format_backpressure, \
+	ACTION_EVENTS_MEMORY_NAME, ACTION_CODE_CHANNEL, PNN_INPUT_SLOTS, DOORBELL_TIMEOUT, BACKPRESSURE_POLICIES, BACKPRESSURE_POLICY, DEFAULT_BODY, PERSON_SLOTS, \
+	OPERATOR_POLICY, DISPLAY_MODE
+from stage_health import NullHealth
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'body-tracker'))
+sys.path.append(os.path.join(ROOT, 'pose-classifier'))
+import body_tracking
+import pnn
+import detect_human_action
+
+# in-process pipeline (launch_detector.py --in-process) - tracker in the main thread (camera + display),
+# classifier and detector in threads, connected by bounded in-memory queues that keep the interfaces of
+# the shared memory channels, so the stage loops are exactly the ones the separate processes run
+POSE_QUEUE_SIZE = 16
+
+class LocalDoorbell:
+	"""in-process doorbell - same ring() / wait() contract as the UDP one: a ring is never lost, one that lands after
+	wait() returned makes the next wait() return at once (rings in between count once, like drained datagrams)"""
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.rung = False
+
+	def ring(self):
+		with self.condition:
+			self.rung = True
+			self.condition.notify()
+
+	# the rung flag is checked and cleared under the lock ring() takes - no ring slips in between
+	def wait(self, timeout=DOORBELL_TIMEOUT):
+		with self.condition:
+			rung = self.condition.wait_for(lambda: self.rung, timeout)
+			self.rung = False
+			return rung
+
+	def close(self):
+		pass
+
+class FrameQueue:
+	"""tracker -> classifier frames (frame ring interface and backpressure policies) - rows are handed over by reference"""
+
+	def __init__(self, size=PNN_INPUT_SLOTS, policy=BACKPRESSURE_POLICY):
+		if policy not in BACKPRESSURE_POLICIES:
+			raise ValueError(f"Unknown backpressure policy: {policy}")
+		self.frames = collections.deque()
+		self.size = size
+		self.policy = policy
+		self.lock = threading.Lock()
+		self.published = 0
+		self.consumed = 0
+		self.skipped = 0
+		self.rejected = 0
+		self.invalid = 0
+		self.repaired = 0
+		self.operator = DEFAULT_BODY
+
+	def set_operator(self, body_id):
+		self.operator = body_id
+
+	def write(self, row, timestamp=None, origin=None, body_id=DEFAULT_BODY, frame=None, repaired=False):
+		timestamp = time.perf_counter() if timestamp is None else timestamp
+		with self.lock:
+			self.repaired += repaired
+			if len(self.frames) == self.size:
+				if self.policy == 'drop-newest':
+					self.rejected += 1
+					return 0
+				self.frames.popleft()
+				self.skipped += 1
+			self.published += 1
+			self.frames.append(Frame(self.published, timestamp, timestamp if origin is None else origin, row, body_id,
+				self.published if frame is None else frame))
+			return self.published
+
+	def discard(self, frames=1):
+		with self.lock:
+			self.invalid += frames
+
+	def read_next(self):
+		with self.lock:
+			return self.frames.popleft() if self.frames else None
+
+	def account(self, consumed=0, skipped=0):
+		with self.lock:
+			self.consumed += consumed
+			self.skipped += skipped
+
+	def stats(self):
+		with self.lock:
+			return {'policy': self.policy, 'produced': self.published + self.rejected, 'consumed': self.consumed,
+				'dropped': self.skipped + self.rejected, 'skipped': self.skipped, 'rejected': self.rejected,
+				'queued': self.published - self.consumed - self.skipped, 'invalid': self.invalid, 'repaired': self.repaired}
+
+class PoseQueue:
+	"""classifier -> detector pose records (pose record interface) - the detector gets every record, oldest first"""
+
+	def __init__(self, size=POSE_QUEUE_SIZE):
+		self.records = collections.deque(maxlen=size)
+		self.lock = threading.Lock()
+		self.latest = None
+		self.seq = 0
+		self.last_seq = 0
+		self.missed = 0
+
+	def write(self, class_id, scores, window_id=0, timestamp=None, origin=None, body_id=DEFAULT_BODY):
+		timestamp = time.perf_counter() if timestamp is None else timestamp
+		with self.lock:
+			self.seq += 1
+			record = PoseRecord(self.seq, timestamp, int(class_id), np.array(scores, dtype=np.float64), window_id,
+				timestamp if origin is None else origin, body_id)
+			self.records.append(record)
+			self.latest = record
+			return self.seq
+
+	# newest record (tracker overlay), None before the first one
+	def read(self, attempts=100):
+		return self.latest
+
+	def read_new(self):
+		with self.lock:
+			if not self.records:
+				return None
+			record = self.records.popleft()
+		if self.last_seq:
+			self.missed += record.seq - self.last_seq - 1
+		self.last_seq = record.seq
+		return record
+
+class PersonPoseTable:
+	"""latest pose of every tracked person (person pose table interface) - the least recently classified one makes room"""
+
+	def __init__(self, size=PERSON_SLOTS):
+		self.poses = collections.OrderedDict()
+		self.size = size
+		self.lock = threading.Lock()
+
+	def write(self, body_id, class_id, scores, window_id=0, timestamp=None, origin=None):
+		timestamp = time.perf_counter() if timestamp is None else timestamp
+		with self.lock:
+			seq = self.poses[body_id].seq + 1 if body_id in self.poses else 1
+			self.poses.pop(body_id, None)
+			self.poses[body_id] = PoseRecord(seq, timestamp, int(class_id), np.array(scores, dtype=np.float64), window_id,
+				timestamp if origin is None else origin, body_id)
+			if len(self.poses) > self.size:
+				self.poses.popitem(last=False)
+			return seq
+
+	def read_all(self, max_age=None):
+		now = time.perf_counter()
+		with self.lock:
+			return {body_id: record for body_id, record in self.poses.items() if max_age is None or now - record.timestamp <= max_age}
+
+# an exception in one stage stops the whole pipeline instead of leaving it half alive
+def stage_thread(name, target, args, stop):
+	def run():
+		try:
+			target(*args)
+		except Exception:
+			print(f"[Pipeline]: {name} stage failed")
+			traceback.print_exc()
+			stop.set()
+	return threading.Thread(target=run, name=name, daemon=True)
+
+# classifier options (pnn.py ones) given to the launcher after --in-process
+def parse_classifier_args(argv):
+	parser = argparse.ArgumentParser(prog='launch_detector.py --in-process')
+	pnn.add_model_arguments(parser)
+	return parser.parse_args(argv)
+
+# runs tracker, classifier and detector in this process until ESC / Ctrl+C / SIGTERM - returns the tracker exit status
+# actions still go to the action_events segment (and action code file) read by the spot controller
+def run_pipeline(argv, trace, backpressure=BACKPRESSURE_POLICY, operator=OPERATOR_POLICY, display=DISPLAY_MODE):
+	args = parse_classifier_args(argv)
+	model = pnn.prepare_model(args)
+
+	frames, frame_doorbell = FrameQueue(policy=backpressure), LocalDoorbell()
+	poses, pose_doorbell = PoseQueue(), LocalDoorbell()
+	person_poses = PersonPoseTable()
+	action_events, action_doorbell = attach_view(ACTION_EVENTS_MEMORY_NAME, ActionEventWriter), DoorbellRinger(ACTION_CODE_CHANNEL)
+	health = NullHealth()
+	stop = threading.Event()
+	signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+	workers = [
+		stage_thread('classifier', pnn.serve, (model, args, frames, frame_doorbell, poses, person_poses, pose_doorbell, trace, health, stop), stop),
+		stage_thread('detector', detect_human_action.detect, (poses, pose_doorbell, action_events, action_doorbell, trace, health, stop), stop),
+	]
+	for worker in workers:
+		worker.start()
+	try:
+		status = body_tracking.run_tracker(frames, frame_doorbell, poses, person_poses, trace, health, stop, operator, display)
+	finally:
+		stop.set()
+		for worker in workers:
+			worker.join()
+		action_events.close()
+		action_doorbell.close()
+	print(f"[Pipeline]: {format_backpressure(frames.stats())}; {poses.seq} poses, {poses.missed} missed")
+	return status
@@ -0,0 +1,125 @@
+import os
+import sys
+import numpy as np
+import psutil
+from multiprocessing import shared_memory, resource_tracker
+
+# shared memory segment lifecycle - the launcher creates every declared segment (reclaiming ones left behind by a
+# crashed run) and removes them at shutdown, stages only attach. The owning launcher is recorded in a small registry
+# segment, so a second launcher refuses to start instead of clobbering a live pipeline.
+REGISTRY_MEMORY_NAME = "segment_registry"
+REGISTRY_DTYPE = np.dtype([
+	('owner_pid', np.int64),
+	('created', np.float64),  # launcher process creation time (tells a reused pid apart)
+])
+
+class Segment:
+	"""declaration of one shared segment - size in bytes, typed view class, writing stage and layout initializer"""
+
+	def __init__(self, name, size, layout, owner, init=None):
+		self.name = name
+		self.size = size
+		self.layout = layout
+		self.owner = owner
+		self.init = init
+
+# segments are kept away from the POSIX resource tracker - it would unlink a segment when any process that opened it
+# exits (a restarted stage, or asynchronously after a launcher crash, when the next launcher already reclaimed the name);
+# removing segments is the launcher's job alone
+_UNTRACKED_OPEN = sys.version_info >= (3, 13)
+
+def _open(name, create=False, size=0):
+	if _UNTRACKED_OPEN:
+		return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+	shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+	if os.name == 'posix':
+		resource_tracker.unregister(shm._name, 'shared_memory')
+	return shm
+
+# opens an existing segment - size is the minimum its declared layout needs
+def attach_segment(name, size=0):
+	shm = _open(name)
+	if shm.size < size:
+		shm.close()
+		raise RuntimeError(f"Shared memory segment {name} has {shm.size} bytes, layout needs {size} - left by another version?")
+	return shm
+
+# the segment is not reachable through its name anymore once every handle is closed (POSIX: right away)
+def remove_segment(shm):
+	shm.close()
+	if os.name == 'posix' and not _UNTRACKED_OPEN:
+		# unlink() unregisters the name from the resource tracker, which must know it then
+		resource_tracker.register(shm._name, 'shared_memory')
+	try:
+		shm.unlink()
+	except FileNotFoundError:
+		if os.name == 'posix' and not _UNTRACKED_OPEN:
+			resource_tracker.unregister(shm._name, 'shared_memory')
+
+def _owner_alive(record):
+	try:
+		return psutil.Process(int(record['owner_pid'])).create_time() <= float(record['created']) + 1
+	except psutil.Error:
+		return False
+
+# new segment of the given size - a leftover of the same name is removed first, or reused zeroed where it cannot be
+# removed (Windows keeps it while any stale process still holds a handle)
+def _create(name, size):
+	try:
+		return _open(name, create=True, size=size)
+	except FileExistsError:
+		pass
+	print(f"[Registry]: reclaiming orphaned segment {name}")
+	remove_segment(_open(name))
+	try:
+		return _open(name, create=True, size=size)
+	except FileExistsError:
+		shm = attach_segment(name, size)
+		np.ndarray((size,), dtype=np.uint8, buffer=shm.buf)[:] = 0
+		return shm
+
+# records this process as owner of the pipeline segments - refuses when another live launcher owns them
+def claim_registry():
+	try:
+		existing = attach_segment(REGISTRY_MEMORY_NAME, REGISTRY_DTYPE.itemsize)
+	except (FileNotFoundError, RuntimeError):
+		existing = None
+	if existing is not None:
+		record = np.ndarray((), dtype=REGISTRY_DTYPE, buffer=existing.buf).copy()
+		existing.close()
+		if record['owner_pid'] != os.getpid() and _owner_alive(record):
+			raise RuntimeError(f"Shared memory segments are owned by a running launcher (PID {int(record['owner_pid'])})")
+		print(f"[Registry]: previous launcher (PID {int(record['owner_pid'])}) did not clean up, reclaiming its segments")
+
+	shm = _create(REGISTRY_MEMORY_NAME, REGISTRY_DTYPE.itemsize)
+	record = np.ndarray((), dtype=REGISTRY_DTYPE, buffer=shm.buf)
+	record['owner_pid'] = os.getpid()
+	record['created'] = psutil.Process().create_time()
+	del record
+	return shm
+
+# creates (or reclaims) the declared segments and runs their layout initializers - returns them in declaration order
+def create_segments(segments):
+	created = []
+	try:
+		for segment in segments:
+			shm = _create(segment.name, segment.size)
+			if segment.init is not None:
+				segment.init(shm)
+			created.append(shm)
+	except Exception:
+		for shm in created:
+			remove_segment(shm)
+		raise
+	return created
+
+# declared segments that currently exist - after a clean shutdown this is empty
+def existing_segments(segments):
+	names = []
+	for segment in [Segment(REGISTRY_MEMORY_NAME, 0, None, 'launcher')] + list(segments):
+		try:
+			attach_segment(segment.name).close()
+			names.append(segment.name)
+		except FileNotFoundError:
+			pass
+	return names
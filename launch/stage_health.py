@@ -0,0 +1,82 @@
+import os
+import time
+import numpy as np
+
+# supervised pipeline stages - one health slot each
+STAGES = ['tracker', 'classifier', 'detector']
+
+STAGE_STARTING = 0  # spawned, loading (model, camera)
+STAGE_READY = 1     # serving - heartbeat is expected from now on
+STAGE_STOPPED = 2   # left its loop on its own
+
+STAGE_STATE_NAMES = {STAGE_STARTING: 'starting', STAGE_READY: 'ready', STAGE_STOPPED: 'stopped'}
+
+# stage_health layout - HEALTH_DTYPE[stages], every slot written only by the process running that stage
+HEALTH_DTYPE = np.dtype([
+	('pid', np.int64),
+	('state', np.int64),
+	('started', np.float64),    # time.monotonic() when the process attached
+	('heartbeat', np.float64),  # time.monotonic() of the last beat
+	('beats', np.int64),
+])
+
+def stage_health_size():
+	return len(STAGES) * HEALTH_DTYPE.itemsize
+
+class StageHealth:
+	"""numpy view onto the stage_health segment - the supervisor side (reads every slot, resets before a spawn)"""
+
+	def __init__(self, shm):
+		self.shm = shm
+		self.slots = np.ndarray((len(STAGES),), dtype=HEALTH_DTYPE, buffer=shm.buf)
+		self.index = {stage: i for i, stage in enumerate(STAGES)}
+
+	def reset(self, stage):
+		i = self.index[stage]
+		self.slots['state'][i] = STAGE_STARTING
+		self.slots['pid'][i] = 0
+		self.slots['started'][i] = 0
+		self.slots['heartbeat'][i] = 0
+		self.slots['beats'][i] = 0
+
+	def get(self, stage):
+		return self.slots[self.index[stage]].copy()
+
+	def close(self):
+		del self.slots
+		self.shm.close()
+
+class HealthReporter(StageHealth):
+	"""stage side - marks the slot ready once loaded and beats once per loop iteration"""
+
+	def __init__(self, shm, stage):
+		super().__init__(shm)
+		self.i = self.index[stage]
+		self.slots['pid'][self.i] = os.getpid()
+		self.slots['started'][self.i] = time.monotonic()
+
+	def ready(self):
+		self.beat()
+		self.slots['state'][self.i] = STAGE_READY
+
+	def beat(self):
+		self.slots['heartbeat'][self.i] = time.monotonic()
+		self.slots['beats'][self.i] += 1
+
+	def stopped(self):
+		self.slots['state'][self.i] = STAGE_STOPPED
+
+class NullHealth:
+	"""stand-in used when the stage runs without the launcher - reports nothing"""
+
+	def ready(self):
+		pass
+
+	def beat(self):
+		pass
+
+	def stopped(self):
+		pass
+
+	def close(self):
+		pass
@@ -0,0 +1,180 @@
+import subprocess
+import time
+import psutil
+from stage_health import STAGE_READY, STAGE_STATE_NAMES
+
+RESTART_POLICIES = ('always', 'on-failure', 'never')
+
+# restart delay doubles from the first value up to the second, and starts over once a stage stayed up STABLE_AFTER seconds
+RESTART_BACKOFF = (1.0, 30.0)
+STABLE_AFTER = 30.0
+
+# a ready stage whose heartbeat is older than this is considered hung and restarted
+HEARTBEAT_TIMEOUT = 5.0
+READY_TIMEOUT = 60.0
+
+class Stage:
+	"""one supervised child process - command line, dependencies, restart policy and its current run"""
+
+	def __init__(self, name, argv, depends=(), restart='on-failure', ready_timeout=READY_TIMEOUT, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+		if restart not in RESTART_POLICIES:
+			raise ValueError(f"Unknown restart policy: {restart}")
+		self.name = name
+		self.argv = argv
+		self.depends = list(depends)
+		self.restart = restart
+		self.ready_timeout = ready_timeout
+		self.heartbeat_timeout = heartbeat_timeout
+
+		self.process = None
+		self.spawned = 0.0
+		self.ready = False
+		self.restarts = 0
+		self.backoff = RESTART_BACKOFF[0]
+		self.next_start = None  # pending restart time
+		self.handled = False    # end of the current run already dealt with
+		self.stats = None       # psutil.Process of the current run
+
+	def running(self):
+		return self.process is not None and self.process.poll() is None
+
+class Supervisor:
+	"""starts stages in dependency order, waits for their readiness, restarts them on crash or lost heartbeat
+
+	Shared memory segments belong to the launcher, so a restarted stage attaches to the same segments and
+	picks up where its previous run stopped (newest window, next pose record / action event).
+	"""
+
+	def __init__(self, stages, health):
+		self.stages = {stage.name: stage for stage in stages}
+		self.order = self._start_order(stages)
+		self.health = health
+
+	def _start_order(self, stages):
+		order = []
+		visiting = set()
+		def visit(stage):
+			if stage.name in order:
+				return
+			if stage.name in visiting:
+				raise ValueError(f"Stage dependency cycle at {stage.name}")
+			visiting.add(stage.name)
+			for dependency in stage.depends:
+				visit(self.stages[dependency])
+			order.append(stage.name)
+		for stage in stages:
+			visit(stage)
+		return order
+
+	def _spawn(self, stage):
+		self.health.reset(stage.name)
+		stage.process = subprocess.Popen(stage.argv)
+		stage.spawned = time.monotonic()
+		stage.ready = False
+		stage.next_start = None
+		stage.handled = False
+		stage.stats = psutil.Process(stage.process.pid)
+		stage.stats.cpu_percent(None)
+		print(f"[Supervisor]: started {stage.name} (PID {stage.process.pid})")
+
+	def _kill(self, stage):
+		if stage.running():
+			stage.process.terminate()
+			try:
+				stage.process.wait(timeout=3)
+			except subprocess.TimeoutExpired:
+				print(f"[Supervisor]: {stage.name} did not terminate gracefully, killing...")
+				stage.process.kill()
+				stage.process.wait()
+
+	# current run ended (exit, hang or startup timeout) - schedule the restart its policy allows
+	def _failed(self, stage, reason):
+		returncode = stage.process.returncode
+		print(f"[Supervisor]: {stage.name} {reason} (exit code {returncode})")
+		now = time.monotonic()
+		stage.ready = False
+		stage.handled = True
+		if stage.restart == 'never' or (stage.restart == 'on-failure' and returncode == 0 and reason == 'exited'):
+			stage.next_start = None
+			return
+		if now - stage.spawned > STABLE_AFTER:
+			stage.backoff = RESTART_BACKOFF[0]
+		stage.next_start = now + stage.backoff
+		print(f"[Supervisor]: restarting {stage.name} in {stage.backoff:.1f} s")
+		stage.backoff = min(2 * stage.backoff, RESTART_BACKOFF[1])
+
+	def _dependencies_ready(self, stage):
+		return all(self.stages[name].ready for name in stage.depends)
+
+	# one supervision pass - readiness, exits, heartbeats and due restarts
+	def poll(self):
+		now = time.monotonic()
+		for name in self.order:
+			stage = self.stages[name]
+			if stage.process is None:
+				continue
+			if not stage.running():
+				if not stage.handled:
+					self._failed(stage, 'exited')
+				if stage.next_start is not None and now >= stage.next_start and self._dependencies_ready(stage):
+					self._spawn(stage)
+					stage.restarts += 1
+				continue
+
+			slot = self.health.get(name)
+			if not stage.ready:
+				if slot['state'] == STAGE_READY and slot['pid'] == stage.process.pid:
+					stage.ready = True
+					print(f"[Supervisor]: {name} ready after {now - stage.spawned:.1f} s")
+				elif now - stage.spawned > stage.ready_timeout:
+					self._kill(stage)
+					self._failed(stage, f"not ready after {stage.ready_timeout:.0f} s")
+			elif now - slot['heartbeat'] > stage.heartbeat_timeout:
+				self._kill(stage)
+				self._failed(stage, f"missed heartbeats for {now - slot['heartbeat']:.1f} s")
+
+	def start(self, poll_interval=0.1):
+		for name in self.order:
+			stage = self.stages[name]
+			self._spawn(stage)
+			while not stage.ready:
+				self.poll()
+				if stage.handled and stage.next_start is None:
+					raise RuntimeError(f"Stage {name} failed to start")
+				time.sleep(poll_interval)
+
+	def stop(self):
+		for name in reversed(self.order):
+			stage = self.stages[name]
+			stage.next_start = None
+			if stage.running():
+				print(f"[Supervisor]: terminating {name} (PID {stage.process.pid})")
+				self._kill(stage)
+
+	def alive(self):
+		return any(stage.running() or stage.next_start is not None for stage in self.stages.values())
+
+	# per stage process state, restarts, cpu % (since the previous report) and resident memory
+	def report(self):
+		rows = []
+		for name in self.order:
+			stage = self.stages[name]
+			cpu = rss = None
+			if stage.running():
+				try:
+					cpu = stage.stats.cpu_percent(None)
+					rss = stage.stats.memory_info().rss / 2**20
+				except psutil.Error:
+					pass
+			state = STAGE_STATE_NAMES.get(int(self.health.get(name)['state']), '?') if stage.running() else 'down'
+			rows.append({'stage': name, 'pid': stage.process.pid if stage.process else None, 'state': state,
+				'restarts': stage.restarts, 'cpu_percent': cpu, 'rss_mb': rss})
+		return rows
+
+def format_report(rows):
+	lines = [f"{'stage':>12} {'pid':>8} {'state':>9} {'restarts':>9} {'cpu %':>7} {'rss MB':>8}"]
+	for row in rows:
+		cpu = '-' if row['cpu_percent'] is None else f"{row['cpu_percent']:.1f}"
+		rss = '-' if row['rss_mb'] is None else f"{row['rss_mb']:.1f}"
+		lines.append(f"{row['stage']:>12} {str(row['pid']):>8} {row['state']:>9} {row['restarts']:>9} {cpu:>7} {rss:>8}")
+	return '\n'.join(lines)
@@ -0,0 +1,121 @@
+import argparse
+import time
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from sklearn.model_selection import train_test_split
+
+import read_data
+from pnn import SIGMA, TAG, print_metrics
+from pnn_model import PNNModel
+from pnn_index import metric_distances
+
+# usage: python condense.py combined_output.csv model\model_reduced.pnn --method kmeans --ratio 20
+# input is the merged training csv (utils/merge_csv.py), output a weighted model artifact for pnn.py --model
+
+WINDOW = 15
+
+# class-wise k-means prototypes - every centroid weighted by the number of rows it replaces
+def kmeans_prototypes(x, y, ratio, seed=0):
+	xs, ys, ws = [], [], []
+	for label in np.unique(y):
+		rows = x[y == label]
+		k = max(1, int(np.ceil(rows.shape[0] / ratio)))
+		centroids, assigned = kmeans2(rows, k, minit='++', seed=seed)
+		counts = np.bincount(assigned, minlength=k)
+		keep = counts > 0
+		xs.append(centroids[keep])
+		ys.append(np.full(np.sum(keep), label))
+		ws.append(counts[keep])
+	return np.concatenate(xs), np.concatenate(ys), np.concatenate(ws).astype(np.float64)
+
+# condensed nearest neighbour (Hart) in batches - keeps every row the current prototypes misclassify
+def cnn_prototypes(x, y, distance, batch=256, seed=0):
+	order = np.random.default_rng(seed).permutation(y.shape[0])
+	x, y = x[order], y[order]
+	selected = np.array([np.flatnonzero(y == label)[0] for label in np.unique(y)])
+
+	changed = True
+	while changed:
+		changed = False
+		for start in range(0, y.shape[0], batch):
+			rows = np.arange(start, min(start + batch, y.shape[0]))
+			nearest = selected[np.argmin(metric_distances(distance, x[rows], x[selected]), axis=1)]
+			wrong = rows[(y[nearest] != y[rows]) & ~np.isin(rows, selected)]
+			if wrong.size:
+				selected = np.concatenate([selected, wrong])
+				changed = True
+
+	# weight - number of same class rows for which the prototype is the nearest one
+	weights = np.zeros(selected.shape[0])
+	for label in np.unique(y):
+		protos = np.flatnonzero(y[selected] == label)
+		members = np.flatnonzero(y == label)
+		for start in range(0, members.shape[0], batch):
+			chunk = members[start:start + batch]
+			nearest = np.argmin(metric_distances(distance, x[chunk], x[selected[protos]]), axis=1)
+			np.add.at(weights, protos[nearest], 1)
+	return x[selected], y[selected], weights
+
+# predictions and mean latency per 15-frame window
+def timed_predict(model, x):
+	predictions = []
+	start = time.perf_counter()
+	for i in range(0, x.shape[0], WINDOW):
+		predictions.append(model.predict(x[i:i + WINDOW]))
+	elapsed = time.perf_counter() - start
+	return np.concatenate(predictions), 1000 * elapsed / max(int(np.ceil(x.shape[0] / WINDOW)), 1)
+
+# evaluation report of the reduced model against the full one
+def report(full, reduced, x_test, y_test):
+	full_pred, full_ms = timed_predict(full, x_test)
+	reduced_pred, reduced_ms = timed_predict(reduced, x_test)
+
+	print(f"Pattern layer: {full.x_train.shape[0]} -> {reduced.x_train.shape[0]} rows "
+		f"({full.x_train.shape[0] / reduced.x_train.shape[0]:.1f}x smaller)")
+	print(f"Latency per window: {full_ms:.2f} ms -> {reduced_ms:.2f} ms")
+	print(f"Agreement with full model: {np.mean(full_pred == reduced_pred):.4f}")
+	print("--- full model ---")
+	print_metrics(y_test, full_pred)
+	print("--- reduced model ---")
+	print_metrics(y_test, reduced_pred)
+
+def main():
+	parser = argparse.ArgumentParser(description='Prototype reduction of a PNN training set')
+	parser.add_argument('csv', help='merged training csv (57 coordinates + label)')
+	parser.add_argument('output', help='output model artifact directory')
+	parser.add_argument('--method', choices=['kmeans', 'cnn'], default='kmeans')
+	parser.add_argument('--ratio', type=float, default=20, help='rows per k-means prototype')
+	parser.add_argument('--test', default=None, help='separate test csv (default: hold out --test-size of input)')
+	parser.add_argument('--test-size', type=float, default=0.2)
+	parser.add_argument('--sigma', type=float, default=SIGMA)
+	parser.add_argument('--tag', type=int, default=TAG)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	data, _ = read_data.input(trainpath = args.csv, isTrain= True)
+	x_train, y_train = data['x_train'], data['y_train']
+	if args.test:
+		test, _ = read_data.input(trainpath = args.test, isTrain= False)
+		x_test, y_test = test['x_test'], test['y_test']
+	else:
+		x_train, x_test, y_train, y_test = train_test_split(
+			x_train, y_train, test_size=args.test_size, stratify=y_train, random_state=args.seed)
+
+	full = PNNModel(x_train, y_train, args.sigma, args.tag)
+
+	print(f"Condensing {x_train.shape[0]} rows with {args.method}...")
+	if args.method == 'kmeans':
+		x_proto, y_proto, weights = kmeans_prototypes(x_train, y_train, args.ratio, seed=args.seed)
+	else:
+		x_proto, y_proto, weights = cnn_prototypes(x_train, y_train, full.distance, seed=args.seed)
+
+	reduced = PNNModel(x_proto, y_proto, args.sigma, args.tag, dtype=np.float32, weights=weights)
+	# laplace kernels normalise by variance ratio of the full training set, not of the prototypes
+	reduced.set_variance_terms(full.within, full.between)
+	reduced.save(args.output)
+	print(f"Saved reduced model to {args.output}")
+
+	report(full, reduced, x_test, y_test)
+
+if __name__ == '__main__':
+	main()
@@ -1,9 +1,13 @@
+import argparse
+import collections
+import queue
 import threading
 import time
 import numpy as np
 import read_data
-import matplotlib.pyplot as plt
-from multiprocessing import shared_memory
+from pnn_model import PNNModel, DTYPES, ARTIFACT_META
+from pnn_index import IndexedPNN, compare_exact
+from streaming import StreamingClassifier, STREAM_WINDOW
 from sklearn.metrics import accuracy_score, \
 							confusion_matrix, \
 							precision_score, \
@@ -12,19 +16,23 @@ from sklearn.metrics import accuracy_score, \
 import os
 import sys
 import signal
-from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'launch'))
+from memory_management import FrameRingReader, WindowAssembler, PoseRecordWriter, PersonPoseWriter, Doorbell, DoorbellRinger, attach_view, attach_latency_trace, \
+							attach_stage_health, PNN_INPUT_MEMORY_NAME, DETECTED_POSE_MEMORY_NAME, PERSON_POSES_MEMORY_NAME, POSE_CLASSES, \
+							DEFAULT_BODY, PERSON_SLOTS, PNN_WINDOW
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 
-MODEL_PATH = "\\model\\model.csv"
+# default model files - next to this module, wherever the process is started from
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+MODEL_PATH = os.path.join(MODEL_DIR, 'model.csv')
+MODEL_ARTIFACT_PATH = os.path.join(MODEL_DIR, 'model.pnn')
 
-# file direct0ry creator function - for launcher usage
-def assemble_dir(str_subfolder: str) -> str:
-    cwd = Path.cwd()
-    output_dir = str(cwd).replace("\\launch", str_subfolder)
-    print(output_dir)
-    return output_dir
+# production hyperparameters
+SIGMA = 0.01867524
+TAG = 3
 
 # Helper function that combines the pattern layer and summation layer
 dic = {'sitting': 0, 'standing': 1, 'sitting_1hand': 2, 'standing_1hand': 3}
@@ -122,19 +130,62 @@ def action_task(label):
 	# print("the robot command can put here!")
 	pass
 
+# single long-lived worker running action_task for prediction changes (instead of a thread per change)
+class ActionNotifier:
+
+	def __init__(self, task=action_task):
+		self.task = task
+		self.events = queue.Queue()
+		self.worker = threading.Thread(target=self._run, daemon=True)
+		self.worker.start()
+
+	def _run(self):
+		while True:
+			label = self.events.get()
+			if label is None:
+				break
+			self.task(label)
+
+	def notify(self, label):
+		self.events.put(label)
+
+	def close(self):
+		self.events.put(None)
+		self.worker.join()
+
+# labels handed to action_task - pose that ended at every prediction change, plus the one before the last frame
+def action_events(predictions):
+	events = []
+	for i in range(1, predictions.shape[0]):
+		if i == predictions.shape[0] - 1 or predictions[i] != predictions[i - 1]:
+			events.extend([k for k, v in dic.items() if v == predictions[i - 1]])
+	return events
+
+# publishes detected pose code with per-class scores (indexed by pose code) to the pose record read by detector and tracker overlay
+# the pose of every tracked person goes to person_poses, pose_record (detector input) gets the operator's only (None otherwise)
+def write_pose_code(value, scores, pose_record, window_id=0, classes=None, origin=None, body_id=DEFAULT_BODY, person_poses=None):
+	if classes is not None:
+		by_code = np.zeros(POSE_CLASSES)
+		by_code[np.asarray(classes, dtype=np.int64)] = scores
+		scores = by_code
+	if person_poses is not None:
+		person_poses.write(body_id, value, scores, window_id, origin=origin)
+	if pose_record is not None:
+		return pose_record.write(value, scores, window_id, origin=origin, body_id=body_id)
+
 # this is function outputting predicition - returns value of pose which will be passed to robot controller
-def handle_prediction(predictions, shm):
+def handle_prediction(predictions, pose_record, window_id=0, origin=None, body_id=DEFAULT_BODY, person_poses=None):
 
-	#find dominant array value
-	values, counts = np.unique(np.array(predictions), return_counts=True)
-	value =  int(values[np.argmax(counts)])
+	#find dominant array value (share of window frames per class is published as its score)
+	counts = np.bincount(np.asarray(predictions, dtype=np.int64), minlength=POSE_CLASSES)
+	value = int(np.argmax(counts))
 	#pose  = [k for k, v in dic.items() if v == value][0]
 	
 	#write pose value to the endpoint
 	# with open(endpoint_path, 'w') as f:
 	# 	f.write(str(value))
 	#shm_value[0] = value
-	shm.buf[:8] = value.to_bytes(8, byteorder='little', signed=True)
+	write_pose_code(value, counts / max(np.sum(counts), 1), pose_record, window_id, origin=origin, body_id=body_id, person_poses=person_poses)
 
 	#ADDITIONALLY writing pose string to another txt endpoint as informative feedback
 	# try:
@@ -145,47 +196,63 @@ def handle_prediction(predictions, shm):
 
 	return value
 
-#PNN implementation
-def PNN(data,sigma,tag):
-	SkeletonConnectionMap = [[1, 0],
-							 [2, 1],
-							 [3, 2],
-							 [4, 2],
-							 [5, 4],
-							 [6, 5],
-							 [7, 6],
-							 [8, 2],
-							 [9, 8],
-							 [10, 9],
-							 [11, 10],
-							 [12, 0],
-							 [13, 12],
-							 [14, 13],
-							 [15, 0],
-							 [16, 15],
-							 [17, 16],
-							 [18, 3],
-							 ]
-	num_testset = data['x_test'].shape[0]
-	d=data['x_train'].shape[1]
-	labels = np.unique(data['y_train'])
-	num_class = len(labels)
-	# Splits the training set into subsets where each subset contains data points from a particular class	
-	x_train_subsets = subset_by_class(data, labels)	
-	p=[len(i[0])/data['x_train'].shape[0] for i in x_train_subsets]
-	within=0
-	between=0
-	for n, subset in enumerate(x_train_subsets):
-		within+=p[n]*np.var(np.array(subset[0]))
-		between+=p[n]*np.sum((np.mean(np.array(subset[0]),axis=0)-np.mean(data['x_train'],axis=0))**2)
-	# Variable for storing the summation layer values from each class
-	summation_layer = np.zeros(num_class)
-	
-	# Variable for storing the predictions formacro each test data point
-	predictions = np.zeros(num_testset)
-	ax = plt.subplot(1, 2, 1)
-
-	fig = plt.subplot(1, 2, 2, projection='3d')
+# model reused by PNN calls without explicit model - rebuilt only when the training arrays change
+_cached_model = None
+_cached_source = None
+_cached_index = None
+
+def get_model(data, sigma, tag, tol=None):
+	global _cached_model, _cached_source, _cached_index
+	source = (data['x_train'], data['y_train'])
+	if _cached_model is None or _cached_source[0] is not source[0] or _cached_source[1] is not source[1]:
+		_cached_model = PNNModel(data['x_train'], data['y_train'], sigma, tag)
+		_cached_source = source
+		_cached_index = None
+	_cached_model.sigma = sigma
+	_cached_model.tag = tag
+	if tol is None:
+		return _cached_model
+
+	# clusters depend only on training rows and distance type - sigma is read at scoring time
+	if _cached_index is None or _cached_index.model is not _cached_model or _cached_index.tol != tol \
+			or _cached_index.distance != _cached_model.distance:
+		_cached_index = IndexedPNN(_cached_model, tol=tol)
+	return _cached_index
+
+SKELETON_CONNECTIONS = [[1, 0],
+						[2, 1],
+						[3, 2],
+						[4, 2],
+						[5, 4],
+						[6, 5],
+						[7, 6],
+						[8, 2],
+						[9, 8],
+						[10, 9],
+						[11, 10],
+						[12, 0],
+						[13, 12],
+						[14, 13],
+						[15, 0],
+						[16, 15],
+						[17, 16],
+						[18, 3],
+						]
+
+# debug / visualisation hook - draws last skeleton of the window with its prediction (enable with --debug-plot)
+_debug_axes = None
+
+def plot_window(x_test, predictions):
+	global _debug_axes
+	import matplotlib.pyplot as plt
+
+	if _debug_axes is None:
+		plt.ion()
+		plt.subplot(1, 2, 1)
+		_debug_axes = plt.subplot(1, 2, 2, projection='3d')
+
+	fig = _debug_axes
+	fig.cla()
 	fig.view_init(-90, 90)
 	fig.set_xlabel('x')
 	fig.set_ylabel('y')
@@ -193,45 +260,30 @@ def PNN(data,sigma,tag):
 	fig.set_xlim(-1.500, 1.500)
 	fig.set_ylim(-1.000, 1.000)
 	fig.set_zlim(-1.000, 1.000)
-	nm=np.unique(data['y_train'])
-	for i, test_point in enumerate(data['x_test']):
-		joints = test_point.reshape([19, 3])
-		for j, subset in enumerate(x_train_subsets):
-			if tag==1:
-				summation_layer[j] = np.sum(
-				gas(test_point, subset[0], sigma)) / (subset[0].shape[0] *pow(2*np.pi, d/2)* pow(sigma,d))
-			elif tag==2:
-				summation_layer[j] = np.sum(
-					mgas(test_point, subset[0], sigma)) / (subset[0].shape[0] * pow(2 * np.pi, d / 2) * pow(sigma, d))
-			elif tag==3:
-				summation_layer[j] = np.sum(
-					cosdistance(test_point, subset[0], sigma)) / (subset[0].shape[0] * pow(2 * np.pi, d / 2) * pow(sigma, d))
-			elif tag==4:
-				summation_layer[j] = np.sum(
-			elaplas(test_point, subset[0], sigma)) / (subset[0].shape[0]*2*pow(sigma,d)*between/within)
-			elif tag==5:
-				summation_layer[j] = np.sum(
-					laplas(test_point, subset[0], sigma)) / (subset[0].shape[0] * 2 * pow(sigma, d) *between / within)
-			elif tag==6:
-				summation_layer[j] = np.sum(
-					colaplas(test_point, subset[0], sigma)) / (subset[0].shape[0] * 2 * pow(sigma, d) * between / within)
-
-		# print(summation_layer, np.argmax(summation_layer),data['y_test'][i])
-		for  n in range(len(summation_layer)):
-			summation_layer[n]=format(summation_layer[n],".3e")
-		predictions[i] = np.argmax(summation_layer)
-		# print([k for k,v in dic.items() if v==predictions[i]])
-		if i==0:
-			continue
-		elif i==predictions.shape[0]-1:
-			thread = threading.Thread(target=action_task, args=([k for k, v in dic.items() if v == predictions[i - 1]]))
-			thread.start()
-			# time.sleep(5)
-		else:
-			if predictions[i]!=predictions[i-1]:
-				thread=threading.Thread(target=action_task,args=([k for k,v in dic.items() if v==predictions[i-1]]))
-				thread.start()
-				# time.sleep(5)
+
+	joints = np.asarray(x_test[-1], dtype=float).reshape([19, 3])
+	for a, b in SKELETON_CONNECTIONS:
+		fig.plot(joints[[a, b], 0], joints[[a, b], 1], joints[[a, b], 2])
+	fig.set_title(str([k for k, v in dic.items() if v == predictions[-1]]))
+	plt.pause(0.001)
+
+#PNN implementation
+def PNN(data,sigma,tag,model=None,tol=None,notifier=None,debug_hook=None):
+	# compiled model holds the class partitioned training set and its cached statistics
+	# tol switches to cluster pruned scoring (relative density error <= tol)
+	if model is None:
+		model = get_model(data, sigma, tag, tol=tol)
+
+	# whole window scored against all classes at once
+	predictions = model.predict(data['x_test'])
+
+	# action notifications go to a long-lived worker, nothing is spawned per window
+	if notifier is not None:
+		for label in action_events(predictions):
+			notifier.notify(label)
+
+	if debug_hook is not None:
+		debug_hook(data['x_test'], predictions)
 
 	return predictions
 
@@ -243,45 +295,209 @@ def print_metrics(y_test, predictions):
 	print('Recall: {}'.format(recall_score(y_test, predictions, average = 'macro')))
 	print('F1: {}'.format(f1_score(y_test, predictions, average='macro')))
 	
+# loads compiled model artifact (memory mapped) if present, otherwise builds the model from training csv
+def load_model(artifact_dir, csv_dir):
+	if os.path.exists(os.path.join(artifact_dir, ARTIFACT_META)):
+		return PNNModel.load(artifact_dir)
+
+	data, _ = read_data.input(trainpath = csv_dir, isTrain= True)
+	return PNNModel(data['x_train'], data['y_train'], SIGMA, TAG)
+
+# compile step - converts training csv into binary model artifact loaded by main
+def compile_main(argv):
+	parser = argparse.ArgumentParser(prog='pnn.py compile')
+	parser.add_argument('csv', help='training set csv (57 coordinates + label)')
+	parser.add_argument('output', help='output model artifact directory')
+	parser.add_argument('--sigma', type=float, default=SIGMA)
+	parser.add_argument('--tag', type=int, default=TAG)
+	parser.add_argument('--dtype', choices=DTYPES, default='float64',
+						help='pattern layer precision - float64 scores like the model built from the csv, check any other one with pnn.py validate first')
+	args = parser.parse_args(argv)
+
+	data, _ = read_data.input(trainpath = args.csv, isTrain= True)
+	model = PNNModel(data['x_train'], data['y_train'], args.sigma, args.tag).astype(args.dtype)
+	model.save(args.output)
+	print(f"Compiled {model.x_train.shape[0]} training rows ({len(model.classes)} classes, {args.dtype}) into {args.output}")
+
+# precision validation - reduced precision models against the float64 reference on the same windows
+def validate_main(argv):
+	parser = argparse.ArgumentParser(prog='pnn.py validate')
+	parser.add_argument('csv', nargs='+', help='stored training set csv(s) - reference model is built from the first')
+	parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=['float32', 'int16'])
+	parser.add_argument('--sigma', type=float, default=SIGMA)
+	parser.add_argument('--tag', type=int, default=TAG)
+	parser.add_argument('--window', type=int, default=15)
+	args = parser.parse_args(argv)
+
+	data, _ = read_data.input(trainpath = args.csv[0], isTrain= True)
+	reference = PNNModel(data['x_train'], data['y_train'], args.sigma, args.tag)
+	x = np.concatenate([read_data.input(trainpath = path, isTrain= False)[0]['x_test'] for path in args.csv])
+	windows = [x[i:i + args.window] for i in range(0, x.shape[0], args.window)]
+
+	def run(model):
+		start = time.perf_counter()
+		log_densities = np.concatenate([model.log_score(window) for window in windows])
+		return log_densities, 1000 * (time.perf_counter() - start) / len(windows)
+
+	ref_log, ref_ms = run(reference)
+	ref_pred = reference.classes[np.argmax(ref_log, axis=1)]
+	print(f"{len(windows)} windows of {args.window} frames, reference float64: {ref_ms:.2f} ms/window, "
+		f"pattern layer {reference.x_train.nbytes / 1e6:.2f} MB")
+	for dtype in args.dtypes:
+		model = reference.astype(dtype)
+		log_densities, ms = run(model)
+		predictions = model.classes[np.argmax(log_densities, axis=1)]
+		stored = model.x_train.size * np.dtype(dtype).itemsize
+		print(f"{dtype:>8}: agreement {np.mean(predictions == ref_pred):.4f}  "
+			f"log density delta mean {np.mean(np.abs(log_densities - ref_log)):.3g} max {np.max(np.abs(log_densities - ref_log)):.3g}  "
+			f"{ms:.2f} ms/window  speedup {ref_ms / ms:.2f}x  stored {stored / 1e6:.2f} MB")
+
+# index report - prediction agreement and latency of pruned versus exact scoring
+def index_report_main(argv):
+	parser = argparse.ArgumentParser(prog='pnn.py index-report')
+	parser.add_argument('model', help='model artifact directory or training set csv')
+	parser.add_argument('test', help='test set csv (57 coordinates + label)')
+	parser.add_argument('--tol', type=float, default=1e-6)
+	args = parser.parse_args(argv)
+
+	model = load_model(args.model, args.model)
+	data, _ = read_data.input(trainpath = args.test, isTrain= False)
+	index = IndexedPNN(model, tol=args.tol)
+	report = compare_exact(index, data['x_test'], data['y_test'])
+	for key, value in report.items():
+		print(f"{key}: {value}")
+
+COMMANDS = {'compile': compile_main, 'index-report': index_report_main, 'validate': validate_main}
+
+# classifier options shared with the in-process launcher (launch_detector.py --in-process)
+def add_model_arguments(parser):
+	parser.add_argument('--index-tol', type=float, default=None, help='cluster pruned scoring with given relative error tolerance')
+	parser.add_argument('--model', default=None, help='model artifact directory (default model/model.pnn)')
+	parser.add_argument('--dtype', choices=DTYPES, default=None, help='run the pattern layer in another precision')
+	parser.add_argument('--debug-plot', action='store_true', help='draw every classified window (slow, debugging only)')
+	parser.add_argument('--stream', choices=['vote', 'log_density'], default=None,
+						help='score only new frames and keep a rolling decision over the last frames')
+
+# model selected by the command line options - loaded once, before the prediction loop
+def prepare_model(args):
+	model = load_model(args.model or MODEL_ARTIFACT_PATH, MODEL_PATH)
+	if args.dtype is not None:
+		model = model.astype(args.dtype)
+	if args.index_tol is not None:
+		model = IndexedPNN(model, tol=args.index_tol)
+	return model
+
+# prediction loop - frames from pnn_input (woken by pnn_input_doorbell), pose codes to pose_record (announced on pose_doorbell)
+# runs until stop is set (in-process pipeline) or the process is terminated
+# windows of every tracked person are classified, the poses of the operator (pnn_input.operator) go to pose_record too
+def serve(model, args, pnn_input, pnn_input_doorbell, pose_record, person_poses, pose_doorbell, trace, health, stop=None):
+	training = getattr(model, 'model', model)  # IndexedPNN wraps the plain model
+	data1 = {'x_train': training.x_train, 'y_train': training.y_train}
+	notifier = ActionNotifier()
+	debug_hook = plot_window if args.debug_plot else None
+	# windows of every person built from its frames - back to back windows of PNN_WINDOW frames, or with --stream
+	# one per new frame (the rolling decision needs only the new frames, the window carries the last STREAM_WINDOW)
+	windows = WindowAssembler(pnn_input, STREAM_WINDOW, 1) if args.stream else WindowAssembler(pnn_input, PNN_WINDOW)
+	# streaming decisions are per person - the one streamed longest ago makes room for a new one
+	streams = collections.OrderedDict()
+	health.ready()
+	
+	while stop is None or not stop.is_set():
+		health.beat()
+		window = windows.read_next()
+		if window is None:
+			pnn_input_doorbell.wait()
+			continue
+		picked = trace.span('queue', window.timestamp)
+		window_id, frames = window.seq, window.frames
+		operator = window.body_id == pnn_input.operator
+		operator_record = pose_record if operator else None
+
+		if args.stream:
+
+			# streaming - the new frames update the rolling decision of the person (started over after a break in its frames)
+			stream = streams.pop(window.body_id, None)
+			if stream is None or window.restart:
+				stream = StreamingClassifier(model, window=STREAM_WINDOW, mode=args.stream)
+			streams[window.body_id] = stream
+			if len(streams) > PERSON_SLOTS:
+				streams.popitem(last=False)
+			previous = stream.decision()
+			value = stream.push_many(frames[-window.new:])
+			write_pose_code(value, stream.scores(), operator_record, window_id, classes=stream.classes, origin=window.origin,
+				body_id=window.body_id, person_poses=person_poses)
+			if operator:
+				pose_doorbell.ring()
+			trace.span('frame_to_pose', window.origin, trace.span('classify', picked))
+			if operator and value != previous:
+				for label in [k for k, v in dic.items() if v == value]:
+					notifier.notify(label)
+
+		else:
+
+			#rearranging arrays
+			data2 = {'x_test': frames, 'y_test': None}
+			ordered_keys = ['x_train', 'x_test', 'y_train', 'y_test']
+			combined = {**data1, **data2}
+			data = {k: combined[k] for k in ordered_keys}
+			
+			#predicitng
+			predictions=PNN(data, model.sigma, model.tag, model=model, notifier=notifier if operator else None, debug_hook=debug_hook)
+
+			#handling predictions
+			# value = handle_prediction(predictions=predictions, endpoint_path=r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\behaviour_code.txt')
+			value = handle_prediction(predictions=predictions, pose_record=operator_record, window_id=window_id, origin=window.origin,
+				body_id=window.body_id, person_poses=person_poses)
+			if operator:
+				pose_doorbell.ring()
+			trace.span('frame_to_pose', window.origin, trace.span('classify', picked))
+	notifier.close()
+
 def main(argv):
 
+	# offline subcommands (python pnn.py compile ...)
+	if len(argv) > 1 and argv[1] in COMMANDS:
+		COMMANDS[argv[1]](argv[2:])
+		return
+
+	parser = argparse.ArgumentParser(prog='pnn.py')
+	parser.add_argument('shm_name', help='detected pose code shared memory segment')
+	add_model_arguments(parser)
+	args = parser.parse_args(argv[1:])
+
 	# mapping onto memory segment detected pose code value holder
-	shm_detected_posed_code = argv[1]
-	shm = shared_memory.SharedMemory(name=shm_detected_posed_code)
+	shm_detected_posed_code = args.shm_name
+	pose_record = attach_view(shm_detected_posed_code, PoseRecordWriter)
+	person_poses = attach_view(PERSON_POSES_MEMORY_NAME, PersonPoseWriter)
+
+	# frames published by the tracker (replaces re-reading prod\19.csv)
+	pnn_input = attach_view(PNN_INPUT_MEMORY_NAME, FrameRingReader)
+
+	# blocks on new frames instead of spinning, wakes the action detector on every new pose code
+	pnn_input_doorbell = Doorbell(PNN_INPUT_MEMORY_NAME)
+	pose_doorbell = DoorbellRinger(DETECTED_POSE_MEMORY_NAME)
+	trace = attach_latency_trace()
+	health = attach_stage_health('classifier')
 
 	def cleanup(signum=None, frame=None):
 		print("[Classifier Module]: cleaning up shared memory...")
-		shm.close()
+		pnn_input_doorbell.close()
+		pose_doorbell.close()
+		pnn_input.close()
+		pose_record.close()
+		person_poses.close()
+		trace.close()
+		health.close()
 		exit(0)
 
 	signal.signal(signal.SIGTERM, cleanup)
 	signal.signal(signal.SIGINT, cleanup)
 
 	#import model
-	model_dir = assemble_dir("\\pose-classifier" + MODEL_PATH)
-	data1, _ = read_data.input(trainpath = model_dir, isTrain= True)
+	model = prepare_model(args)
 	
 	# prediction loop
-	while True:
-		data2, read_data_single_exit_code = read_data.input(trainpath = r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\19.csv', isTrain = False)
-
-		if read_data_single_exit_code == 1:
-
-			#rearranging arrays
-			ordered_keys = ['x_train', 'x_test', 'y_train', 'y_test']
-			combined = {**data1, **data2}
-			data = {k: combined[k] for k in ordered_keys}
-			
-			#predicitng
-			predictions=PNN(data, 0.01867524 , 3)
-
-			#handling predictions
-			# value = handle_prediction(predictions=predictions, endpoint_path=r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\behaviour_code.txt')
-			value = handle_prediction(predictions=predictions, shm=shm)
-		
-		else:
-			print("Corrupted data - prediciton skipped")
-			continue
+	serve(model, args, pnn_input, pnn_input_doorbell, pose_record, person_poses, pose_doorbell, trace, health)
 	
 if __name__ == '__main__':
 	main(sys.argv)
\ No newline at end of file
@@ -0,0 +1,198 @@
+import time
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from scipy.spatial.distance import cdist
+from scipy.special import logsumexp
+from pnn_model import kernel_distances
+
+DEFAULT_TOL = 1e-6
+CLUSTER_SIZE = 64
+
+# metric distances (N x M) behind the PNN kernels - euclidean, L1 or folded angle (all satisfy triangle inequality)
+def metric_distances(distance, x, rows):
+	if distance == 'cityblock':
+		return cdist(x, rows, 'cityblock')
+
+	if distance == 'sqeuclidean':
+		sq = np.einsum('ij,ij->i', x, x)[:, None] + np.einsum('ij,ij->i', rows, rows)[None, :] - 2 * (x @ rows.T)
+		return np.sqrt(np.maximum(sq, 0))
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		cos = (x @ rows.T) / (np.linalg.norm(x, axis=1)[:, None] * np.linalg.norm(rows, axis=1)[None, :])
+		angle = np.nan_to_num(np.arccos(np.clip(cos, -1, 1)))
+	return np.minimum(angle, np.pi - angle)
+
+class IndexedPNN:
+	"""Cluster pruned PNN scoring on top of a PNNModel.
+
+	Every class block is split into k-means clusters with a centroid and a covering radius.
+	For a window, a cluster is skipped when the triangle inequality bound shows all its kernel
+	terms are below tol / n_c of the nearest training row (weight adjusted for weighted models), so the skipped mass is at most tol
+	relative to the class sum (log density error <= tol).
+
+	The cluster ordered blocks and their norms are kept in the precision of the model's matrix and
+	scored with the same kernel distances, so pruning is the only difference to exact scoring.
+	"""
+
+	def __init__(self, model, tol=DEFAULT_TOL, cluster_size=CLUSTER_SIZE, seed=0):
+		self.model = model
+		self.tol = tol
+		self.distance = model.distance
+		self.classes = model.classes
+		self.dtype = model.x_train.dtype
+		self.evaluated = 0
+		self.total = 0
+
+		self.blocks = []
+		self.block_sq_norms = []
+		self.block_norms = []
+		self.block_weights = []
+		self.row_clusters = []
+		self.centroids = []
+		self.radii = []
+		for j, subset in enumerate(model.subsets()):
+			points = np.asarray(subset, dtype=np.float64)
+			if self.distance == 'angle':
+				norms = np.linalg.norm(points, axis=1)
+				points = points / np.where(norms == 0, 1, norms)[:, None]
+
+			k = max(1, points.shape[0] // cluster_size)
+			_, labels = kmeans2(points, k, minit='++', seed=seed)
+
+			# clusters as contiguous row ranges, empty clusters dropped
+			order = np.argsort(labels, kind='stable')
+			ids, starts = np.unique(labels[order], return_index=True)
+			block = np.ascontiguousarray(np.asarray(subset)[order])
+			offsets = np.append(starts, block.shape[0])
+
+			centroids = np.array([points[order[offsets[c]:offsets[c + 1]]].mean(axis=0) for c in range(len(ids))])
+			radii = np.array([
+				metric_distances(self.distance, centroids[c:c + 1], np.asarray(block[offsets[c]:offsets[c + 1]], dtype=np.float64)).max()
+				for c in range(len(ids))])
+			if self.distance == 'angle':
+				# zero vectors sit at angle 0 from everything (see cosdistance) - their clusters are never pruned
+				zero = np.linalg.norm(np.asarray(block, dtype=np.float64), axis=1) == 0
+				radii[[c for c in range(len(ids)) if zero[offsets[c]:offsets[c + 1]].any()]] = np.pi / 2
+
+			rows = slice(model.offsets[j], model.offsets[j + 1])
+			self.blocks.append(block)
+			self.block_sq_norms.append(np.ascontiguousarray(model.matrix_sq_norms[rows][order]))
+			self.block_norms.append(np.ascontiguousarray(model.norms[rows][order]) if self.distance == 'angle' else None)
+			self.block_weights.append(None if model.weights is None else model.class_row_weights(j)[order])
+			self.row_clusters.append(np.repeat(np.arange(len(ids)), np.diff(offsets)))
+			self.centroids.append(centroids)
+			self.radii.append(radii)
+
+	@property
+	def sigma(self):
+		return self.model.sigma
+
+	@property
+	def tag(self):
+		return self.model.tag
+
+	# metric distance -> kernel argument (what goes into exp(-...))
+	def _scaled(self, r):
+		if self.model.bandwidth == 'gauss':
+			h = 2 * self.model.sigma * self.model.sigma
+		else:
+			h = self.model.sigma
+		if self.distance == 'sqeuclidean':
+			return r * r / h
+		return r / h
+
+	# kernel exponents (N x rows) of the rows of class block j in the selected clusters (boolean per cluster),
+	# computed like PNNModel.distances in the matrix precision - a fully selected block is not gathered
+	def _exponents(self, j, x, clusters):
+		block = self.blocks[j]
+		if clusters.all():
+			rows = slice(None)
+			count = block.shape[0]
+			dist = kernel_distances(self.distance, x, block, self.block_sq_norms[j], self.block_norms[j])
+		else:
+			rows = np.flatnonzero(clusters[self.row_clusters[j]])
+			count = rows.shape[0]
+			norms = self.block_norms[j]
+			dist = kernel_distances(self.distance, x, block[rows], self.block_sq_norms[j][rows], None if norms is None else norms[rows])
+		return self.model.exponents(dist), rows, count
+
+	# pruned summation layer in log space - same output as PNNModel.log_score within tol
+	def log_score(self, x):
+		x = np.asarray(x, dtype=np.float64)
+		x_matrix = np.asarray(x, dtype=self.dtype)
+		log_sums = np.empty((x.shape[0], len(self.classes)))
+
+		for j, block in enumerate(self.blocks):
+			to_centroids = metric_distances(self.distance, x, self.centroids[j])
+			lower = self._scaled(np.maximum(to_centroids - self.radii[j][None, :], 0))
+
+			# exact nearest terms inside the closest clusters bound the largest kernel term from below
+			weights = self.block_weights[j]
+			closest = np.zeros(to_centroids.shape[1], dtype=bool)
+			closest[np.argmin(to_centroids, axis=1)] = True
+			nearest = -self._exponents(j, x_matrix, closest)[0].max(axis=1)
+			ratio = block.shape[0] / self.tol if weights is None else np.sum(weights) / (self.tol * np.min(weights))
+			cut = nearest + np.log(ratio)
+
+			# clusters that may hold a non negligible term for any frame of the window
+			selected = np.any(lower <= cut[:, None], axis=0)
+			exponents, rows, count = self._exponents(j, x_matrix, selected)
+			log_sums[:, j] = logsumexp(exponents, axis=1, b=None if weights is None else weights[rows][None, :])
+
+			self.evaluated += count * x.shape[0]
+			self.total += block.shape[0] * x.shape[0]
+
+		return log_sums - self.model.log_normalisers
+
+	def score(self, x):
+		return np.exp(self.log_score(x))
+
+	def classify(self, x):
+		log_densities = self.log_score(x)
+		return self.classes[np.argmax(log_densities, axis=1)], log_densities
+
+	def predict(self, x):
+		predictions, _ = self.classify(x)
+		return predictions
+
+# accuracy / latency delta of pruned scoring versus exact scoring on the same windows - the exact reference is the
+# wrapped model itself, in the same precision (float32 deltas include rounding of the per-class sums)
+def compare_exact(index, x, y=None, window=15):
+	x = np.asarray(x, dtype=np.float64)
+	exact_time = 0.0
+	indexed_time = 0.0
+	exact = []
+	pruned = []
+	index.evaluated = 0
+	index.total = 0
+
+	for start in range(0, x.shape[0], window):
+		chunk = x[start:start + window]
+		t = time.perf_counter()
+		exact.append(index.model.log_score(chunk))
+		exact_time += time.perf_counter() - t
+
+		t = time.perf_counter()
+		pruned.append(index.log_score(chunk))
+		indexed_time += time.perf_counter() - t
+
+	windows = max(len(exact), 1)
+	exact = np.concatenate(exact)
+	pruned = np.concatenate(pruned)
+	exact_pred = index.classes[np.argmax(exact, axis=1)]
+	pruned_pred = index.classes[np.argmax(pruned, axis=1)]
+
+	report = {
+		'windows': windows,
+		'tol': index.tol,
+		'dtype': index.model.storage_dtype,
+		'agreement': float(np.mean(exact_pred == pruned_pred)),
+		'max_log_density_delta': float(np.max(np.abs(exact - pruned))),
+		'evaluated_fraction': index.evaluated / max(index.total, 1),
+		'exact_ms_per_window': 1000 * exact_time / windows,
+		'indexed_ms_per_window': 1000 * indexed_time / windows,
+	}
+	if y is not None:
+		report['exact_accuracy'] = float(np.mean(exact_pred == y))
+		report['indexed_accuracy'] = float(np.mean(pruned_pred == y))
+	return report
@@ -0,0 +1,300 @@
+import copy
+import json
+import os
+import numpy as np
+from scipy.spatial.distance import cdist
+from scipy.special import logsumexp
+
+# kernel tag -> (distance type, bandwidth type) - mirrors gas/mgas/cosdistance/elaplas/laplas/colaplas in pnn.py
+KERNELS = {
+	1: ('sqeuclidean', 'gauss'),
+	2: ('cityblock', 'gauss'),
+	3: ('angle', 'gauss'),
+	4: ('sqeuclidean', 'laplace'),
+	5: ('cityblock', 'laplace'),
+	6: ('angle', 'laplace'),
+}
+
+# compiled model artifact - directory of .npy arrays (memory-mappable) plus json metadata
+ARTIFACT_VERSION = 1
+ARTIFACT_ARRAYS = ['x_train', 'classes', 'offsets', 'sq_norms']
+ARTIFACT_OPTIONAL = ['weights']
+ARTIFACT_META = 'meta.json'
+
+# precision modes of the pattern layer - int16 is storage only, scoring runs on the dequantized float32 matrix
+DTYPES = ['float64', 'float32', 'int16']
+
+# symmetric int16 quantisation of root relative coordinates - one scale for the whole matrix
+def quantize_int16(x):
+	x = np.asarray(x, dtype=np.float64)
+	scale = float(np.max(np.abs(x))) / np.iinfo(np.int16).max if x.size else 0.0
+	if scale == 0.0:
+		scale = 1.0
+	return np.round(x / scale).astype(np.int16), scale
+
+def dequantize_int16(q, scale):
+	return np.asarray(q, dtype=np.float32) * np.float32(scale)
+
+# kernel distances (N x M) between window frames and training rows in the precision of the rows - squared euclidean,
+# L1 or the angle folded onto [0, pi/2] like cosdistance/colaplas; sq_norms / norms - precomputed ones of the rows
+def kernel_distances(distance, x, rows, sq_norms=None, norms=None):
+	if distance == 'sqeuclidean':
+		# everything in the matrix precision - float32 models never upcast the N x n_train block
+		x_sq = np.einsum('ij,ij->i', x, x)
+		dist = x_sq[:, None] + sq_norms[None, :] - 2 * (x @ rows.T)
+		return np.maximum(dist, 0)
+
+	if distance == 'cityblock':
+		return cdist(x, rows, 'cityblock')
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		cos = (x @ rows.T) / (np.linalg.norm(x, axis=1)[:, None] * norms[None, :])
+		angle = np.nan_to_num(np.arccos(np.clip(cos, -1, 1)))
+	return np.minimum(angle, np.pi - angle)
+
+class PNNModel:
+	"""Compiled PNN - keeps the class partitioned training matrix and scores whole windows at once.
+
+	Everything that does not depend on the test window (class partition, norms, priors,
+	within/between variance terms, log normalisation constants) is computed once and cached;
+	changing sigma only drops the normalisers, changing training data drops everything.
+
+	Optional per-row weights turn the summation layer into a weighted density estimate
+	(prototype reduced models, see condense.py).
+	"""
+
+	def __init__(self, x_train, y_train, sigma, tag, dtype=np.float64, weights=None):
+		self._sigma = sigma
+		self.tag = tag
+		self.set_training_data(x_train, y_train, dtype=dtype, weights=weights)
+
+	# (re)partitions training set - invalidates every cached statistic
+	def set_training_data(self, x_train, y_train, dtype=np.float64, weights=None):
+		x_train = np.asarray(x_train, dtype=dtype)
+		y_train = np.asarray(y_train).astype(np.int64)
+
+		# sort training rows by class so every class is one contiguous block
+		order = np.argsort(y_train, kind='stable')
+		self.x_train = np.ascontiguousarray(x_train[order])
+		self.y_train = y_train[order]
+		self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)[order]
+		self.scale = None
+		self.classes, starts, counts = np.unique(self.y_train, return_index=True, return_counts=True)
+		self.offsets = np.append(starts, self.y_train.shape[0])
+
+		# squared norms reused by the BLAS based distances
+		self.sq_norms = np.einsum('ij,ij->i', self.x_train, self.x_train, dtype=np.float64)
+		self._reset_cache()
+
+	def _reset_cache(self):
+		self.counts = np.diff(self.offsets)
+		self.d = self.x_train.shape[1]
+		if self.weights is None:
+			self.class_weights = self.counts.astype(np.float64)
+		else:
+			self.class_weights = np.add.reduceat(self.weights, self.offsets[:-1])
+		self.p = self.class_weights / np.sum(self.class_weights)
+		self._cast_sq_norms()
+		self._norms = None
+		self._within = None
+		self._between = None
+		self._log_norm = None
+
+	@property
+	def sigma(self):
+		return self._sigma
+
+	@sigma.setter
+	def sigma(self, value):
+		if value != self._sigma:
+			self._sigma = value
+			self._log_norm = None
+
+	@property
+	def tag(self):
+		return self._tag
+
+	@tag.setter
+	def tag(self, value):
+		if value not in KERNELS:
+			raise ValueError(f"Unknown kernel tag: {value}")
+		self._tag = value
+		self.distance, self.bandwidth = KERNELS[value]
+		self._log_norm = None
+
+	# per-row weights of one class block (ones for an unweighted model)
+	def class_row_weights(self, j):
+		if self.weights is None:
+			return np.ones(self.counts[j])
+		return self.weights[self.offsets[j]:self.offsets[j + 1]]
+
+	# within/between class variance terms (used by the laplace kernels)
+	def _variance_terms(self):
+		total_mean = np.average(self.x_train, axis=0, weights=self.weights)
+		self._within = 0.0
+		self._between = 0.0
+		for n, subset in enumerate(self.subsets()):
+			w = self.class_row_weights(n)
+			mean = np.average(subset, axis=0, weights=w)
+			self._within += self.p[n] * float(np.average(np.mean((subset - np.mean(mean)) ** 2, axis=1), weights=w))
+			self._between += self.p[n] * float(np.sum((mean - total_mean) ** 2))
+
+	@property
+	def within(self):
+		if self._within is None:
+			self._variance_terms()
+		return self._within
+
+	@property
+	def between(self):
+		if self._between is None:
+			self._variance_terms()
+		return self._between
+
+	# variance terms taken from elsewhere (e.g. the full training set of a prototype reduced model)
+	def set_variance_terms(self, within, between):
+		self._within = within
+		self._between = between
+		self._log_norm = None
+
+	# squared norms in the matrix precision, added to every window's distances without a per-window cast
+	def _cast_sq_norms(self):
+		self.matrix_sq_norms = np.asarray(self.sq_norms, dtype=self.x_train.dtype)
+
+	@property
+	def norms(self):
+		if self._norms is None:
+			self._norms = np.sqrt(self.sq_norms).astype(self.x_train.dtype)
+		return self._norms
+
+	# copy of the model with the pattern layer in another precision ('float64', 'float32' or 'int16')
+	# class partition, weights and variance terms are shared with the original
+	def astype(self, dtype):
+		model = copy.copy(self)
+		if np.dtype(dtype) == np.int16:
+			q, scale = quantize_int16(self.x_train)
+			model.x_train = dequantize_int16(q, scale)
+			model.scale = scale
+		else:
+			model.x_train = np.ascontiguousarray(self.x_train, dtype=dtype)
+			model.scale = None
+		model.sq_norms = np.einsum('ij,ij->i', model.x_train, model.x_train, dtype=np.float64)
+		model._cast_sq_norms()
+		model._norms = None
+		return model
+
+	# storage precision of the pattern layer
+	@property
+	def storage_dtype(self):
+		return 'int16' if self.scale is not None else self.x_train.dtype.name
+
+	# per-class log density normalisation - log of the original summation layer denominators
+	@property
+	def log_normalisers(self):
+		if self._log_norm is None:
+			log_norm = np.log(self.class_weights) + self.d * np.log(self.sigma)
+			if self.bandwidth == 'gauss':
+				log_norm += self.d / 2 * np.log(2 * np.pi)
+			else:
+				log_norm += np.log(2) + np.log(self.between / self.within)
+			self._log_norm = log_norm
+		return self._log_norm
+
+	# writes the model as a compiled artifact directory (arrays first, metadata last)
+	def save(self, path):
+		os.makedirs(path, exist_ok=True)
+		for name in ARTIFACT_ARRAYS + ARTIFACT_OPTIONAL:
+			array = getattr(self, name)
+			if name == 'x_train' and self.scale is not None:
+				# quantized model - x_train holds exact multiples of scale, stored back as int16
+				array = np.round(np.asarray(array, dtype=np.float64) / self.scale).astype(np.int16)
+			if array is not None:
+				np.save(os.path.join(path, name + '.npy'), array)
+
+		meta = {
+			'version': ARTIFACT_VERSION,
+			'sigma': float(self.sigma),
+			'tag': int(self.tag),
+			'dtype': self.storage_dtype,
+			'within': float(self.within),
+			'between': float(self.between),
+		}
+		if self.scale is not None:
+			meta['scale'] = self.scale
+		with open(os.path.join(path, ARTIFACT_META), 'w') as f:
+			json.dump(meta, f, indent=2)
+
+	# maps a compiled artifact - arrays stay memory mapped, nothing is recomputed
+	# (int16 artifacts are dequantized to float32 once at load)
+	@classmethod
+	def load(cls, path, mmap=True):
+		with open(os.path.join(path, ARTIFACT_META)) as f:
+			meta = json.load(f)
+		if meta['version'] != ARTIFACT_VERSION:
+			raise ValueError(f"Unsupported model artifact version: {meta['version']}")
+
+		model = cls.__new__(cls)
+		for name in ARTIFACT_ARRAYS:
+			setattr(model, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None))
+		for name in ARTIFACT_OPTIONAL:
+			array_path = os.path.join(path, name + '.npy')
+			setattr(model, name, np.load(array_path) if os.path.exists(array_path) else None)
+
+		model.scale = meta.get('scale')
+		if model.scale is not None:
+			model.x_train = dequantize_int16(model.x_train, model.scale)
+
+		model._sigma = meta['sigma']
+		model.tag = meta['tag']
+		model._reset_cache()
+		model.y_train = np.repeat(model.classes, model.counts)
+		model._within = meta['within']
+		model._between = meta['between']
+		return model
+
+	# training rows of every class (views, no copy)
+	def subsets(self):
+		return [self.x_train[self.offsets[j]:self.offsets[j + 1]] for j in range(len(self.classes))]
+
+	# pairwise distances (N x n_train) between the window and the whole training matrix
+	def distances(self, x):
+		x = np.asarray(x, dtype=self.x_train.dtype)
+		return kernel_distances(self.distance, x, self.x_train, self.matrix_sq_norms,
+			self.norms if self.distance == 'angle' else None)
+
+	# summation layer in log space - per-class log densities (N x num_class) for a whole window
+	def log_score(self, x):
+		return self.log_score_distances(self.distances(x))
+
+	# kernel exponents (what goes into exp(...)) of distances as returned by distances / kernel_distances
+	def exponents(self, dist):
+		if self.bandwidth == 'gauss':
+			return dist / (-2 * self.sigma * self.sigma)
+		return dist / -self.sigma
+
+	# summation layer from precomputed distances (N x n_train, as returned by distances)
+	def log_score_distances(self, dist):
+		exponent = self.exponents(dist)
+
+		log_sums = np.empty((exponent.shape[0], len(self.classes)))
+		for j in range(len(self.classes)):
+			block = exponent[:, self.offsets[j]:self.offsets[j + 1]]
+			if self.weights is None:
+				log_sums[:, j] = logsumexp(block, axis=1)
+			else:
+				log_sums[:, j] = logsumexp(block, axis=1, b=self.class_row_weights(j)[None, :])
+
+		return log_sums - self.log_normalisers
+
+	# per-class densities - may under/overflow for large d, use log_score for decisions
+	def score(self, x):
+		return np.exp(self.log_score(x))
+
+	# predicted labels and per-class log densities for a window
+	def classify(self, x):
+		log_densities = self.log_score(x)
+		return self.classes[np.argmax(log_densities, axis=1)], log_densities
+
+	def predict(self, x):
+		predictions, _ = self.classify(x)
+		return predictions
@@ -15,21 +15,14 @@ def input(trainpath, isTrain = True):
 	except pd.errors.EmptyDataError:
 		return pd.DataFrame(), 0
 
-	sizetrain = file_out_t.iloc[0:, 0:osize].values.shape[0]
-	x_train = file_out_t.iloc[0:sizetrain, 0:osize].values
-	y_train = file_out_t.iloc[0:sizetrain, osize].values
-	
-	for n in range(len(y_train)):
-		if y_train[n]=="sittting" :
-			y_train[n]="sitting"
-	label=y_train
-	t=[]
-	for k in y_train:
-		t.append(d[str(k)])
-	y_train=np.array(t)
-	mm=[]
-	for i in range(len(label)):
-		mm.append(str(label[i])+"-"+str(y_train[i]))
+	x_train = file_out_t.iloc[:, 0:osize].to_numpy(dtype=np.float64)
+
+	# label strings -> class codes in one pass (fixing 'sittting' typo from older recordings)
+	labels = file_out_t.iloc[:, osize].astype(str).replace("sittting", "sitting")
+	unknown = labels[~labels.isin(list(d))]
+	if len(unknown) > 0:
+		raise KeyError(unknown.iloc[0])
+	y_train = labels.map(d).to_numpy(dtype=np.int64)
 	
 	if isTrain:
 		data = {'x_train': x_train,  
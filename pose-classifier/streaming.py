@@ -0,0 +1,75 @@
+import numpy as np
+from scipy.special import logsumexp
+
+STREAM_WINDOW = 15
+
+class StreamingClassifier:
+	"""Frame by frame PNN classification with a rolling decision over the last `window` frames.
+
+	Per-frame class log densities live in a ring buffer; the majority vote (mode='vote') or the
+	summed log density (mode='log_density') of the window is updated incrementally as frames
+	enter and leave, so every new frame costs one row of scoring instead of a whole window.
+	"""
+
+	def __init__(self, model, window=STREAM_WINDOW, mode='vote'):
+		if mode not in ('vote', 'log_density'):
+			raise ValueError(f"Unknown streaming mode: {mode}")
+		self.model = model
+		self.window = window
+		self.mode = mode
+		self.classes = model.classes
+
+		num_class = len(self.classes)
+		self.log_densities = np.zeros((window, num_class))
+		self.predictions = np.zeros(window, dtype=np.int64)
+		self.votes = np.zeros(num_class, dtype=np.int64)
+		self.log_sum = np.zeros(num_class)
+		self.head = 0
+		self.filled = 0
+
+	def _insert(self, log_density):
+		slot = self.head
+		if self.filled == self.window:
+			# frame leaving the window
+			self.votes[self.predictions[slot]] -= 1
+			self.log_sum -= self.log_densities[slot]
+		else:
+			self.filled += 1
+
+		prediction = int(np.argmax(log_density))
+		self.log_densities[slot] = log_density
+		self.predictions[slot] = prediction
+		self.votes[prediction] += 1
+		self.log_sum += log_density
+
+		self.head = (slot + 1) % self.window
+		if self.head == 0:
+			# re-sum once per lap so add/subtract rounding never accumulates
+			self.log_sum = np.sum(self.log_densities[:self.filled], axis=0)
+
+	# scores new frames (one matrix operation for all of them) and returns the current decision
+	def push_many(self, frames):
+		frames = np.atleast_2d(frames)
+		if frames.shape[0] > 0:
+			for log_density in self.model.log_score(frames[-self.window:]):
+				self._insert(log_density)
+		return self.decision()
+
+	def push(self, frame):
+		return self.push_many(np.asarray(frame).reshape(1, -1))
+
+	# rolling decision - label of the window majority (ties go to the lowest label, like handle_prediction)
+	def decision(self):
+		if self.filled == 0:
+			return None
+		if self.mode == 'vote':
+			return int(self.classes[np.argmax(self.votes)])
+		return int(self.classes[np.argmax(self.log_sum)])
+
+	# per-class confidence of the decision (model class order) - vote share or normalised window posterior
+	def scores(self):
+		if self.filled == 0:
+			return np.zeros(len(self.classes))
+		if self.mode == 'vote':
+			return self.votes / self.filled
+		return np.exp(self.log_sum - logsumexp(self.log_sum))
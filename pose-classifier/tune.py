@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.format import open_memmap
+from sklearn.metrics import precision_score, recall_score, f1_score
+from sklearn.model_selection import train_test_split
+from threadpoolctl import threadpool_limits
+
+import read_data
+from pnn import SIGMA, TAG
+from pnn_model import PNNModel, KERNELS
+
+# usage: python tune.py model\model.csv --test holdout.csv --sigmas 0.005 0.01 0.0187 0.03 --tags 1 2 3 4 5 6
+# distance matrices (test x train) are computed once per distance type and cached on disk,
+# sigma x tag configurations are then scored from the cache across a process pool; the best ones (--shortlist)
+# are timed afterwards one by one in this process, with the pool gone and BLAS threads as in production
+
+WINDOW = 15
+CHUNK = 512
+
+# cached test x train distance matrix for one distance type (float32 .npy, memory mapped by workers)
+def cached_distances(model, x_test, kind, cache_dir):
+	digest = hashlib.sha1()
+	digest.update(np.ascontiguousarray(model.x_train).tobytes())
+	digest.update(np.ascontiguousarray(x_test).tobytes())
+	path = os.path.join(cache_dir, f"{digest.hexdigest()[:16]}_{kind}.npy")
+	if os.path.exists(path):
+		return path
+
+	os.makedirs(cache_dir, exist_ok=True)
+	tag = next(t for t, (distance, _) in KERNELS.items() if distance == kind)
+	model.tag = tag
+	tmp_path = path + '.tmp.npy'
+	out = open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(x_test.shape[0], model.x_train.shape[0]))
+	for start in range(0, x_test.shape[0], CHUNK):
+		out[start:start + CHUNK] = model.distances(x_test[start:start + CHUNK])
+	out.flush()
+	del out
+	os.replace(tmp_path, path)
+	return path
+
+# per worker state - one model and the memory mapped distance matrices
+_worker = {}
+
+def _init_worker(x_train, y_train, y_test, cache_files):
+	# one BLAS thread per worker - parallelism comes from the pool
+	threadpool_limits(1)
+	_worker['model'] = PNNModel(x_train, y_train, SIGMA, TAG)
+	_worker['y_test'] = y_test
+	_worker['distances'] = {kind: np.load(path, mmap_mode='r') for kind, path in cache_files.items()}
+
+def _evaluate(config):
+	sigma, tag = config
+	model = _worker['model']
+	model.sigma = sigma
+	model.tag = tag
+	dist = _worker['distances'][model.distance]
+	y_test = _worker['y_test']
+
+	predictions = []
+	for start in range(0, dist.shape[0], CHUNK):
+		log_densities = model.log_score_distances(np.asarray(dist[start:start + CHUNK], dtype=np.float64))
+		predictions.append(model.classes[np.argmax(log_densities, axis=1)])
+	predictions = np.concatenate(predictions)
+
+	return {
+		'sigma': sigma,
+		'tag': tag,
+		'precision': precision_score(y_test, predictions, average='macro', zero_division=0),
+		'recall': recall_score(y_test, predictions, average='macro', zero_division=0),
+		'f1': f1_score(y_test, predictions, average='macro', zero_division=0),
+		'ms_per_window': None,
+	}
+
+# median inference time of one configuration end to end (distances included) on live sized windows - run alone, never
+# next to the pool, so the numbers are those of the live classifier
+def time_config(model, config, timing_windows):
+	model.sigma, model.tag = config
+	model.predict(timing_windows[0])
+	timings = []
+	for window in timing_windows:
+		start = time.perf_counter()
+		model.predict(window)
+		timings.append(1000 * (time.perf_counter() - start))
+	return float(np.median(timings))
+
+def main():
+	parser = argparse.ArgumentParser(description='Parallel sigma x kernel tag search for the PNN classifier')
+	parser.add_argument('csv', help='training csv (57 coordinates + label)')
+	parser.add_argument('--test', default=None, help='separate test csv (default: hold out --test-size of input)')
+	parser.add_argument('--test-size', type=float, default=0.2)
+	parser.add_argument('--max-test', type=int, default=2000, help='cap on test rows (distance cache is test x train)')
+	parser.add_argument('--sigmas', type=float, nargs='+', default=[SIGMA / 4, SIGMA / 2, SIGMA, SIGMA * 2, SIGMA * 4])
+	parser.add_argument('--tags', type=int, nargs='+', default=sorted(KERNELS))
+	parser.add_argument('--workers', type=int, default=os.cpu_count())
+	parser.add_argument('--timing-windows', type=int, default=20)
+	parser.add_argument('--shortlist', type=int, default=5, help='best configurations (f1) timed after the sweep')
+	parser.add_argument('--cache-dir', default='tune_cache')
+	parser.add_argument('--json', default=None, help='write results to json file')
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	data, _ = read_data.input(trainpath = args.csv, isTrain= True)
+	x_train, y_train = data['x_train'], data['y_train']
+	if args.test:
+		test, _ = read_data.input(trainpath = args.test, isTrain= False)
+		x_test, y_test = test['x_test'], test['y_test']
+	else:
+		x_train, x_test, y_train, y_test = train_test_split(
+			x_train, y_train, test_size=args.test_size, stratify=y_train, random_state=args.seed)
+	if x_test.shape[0] > args.max_test:
+		keep = np.random.default_rng(args.seed).choice(x_test.shape[0], args.max_test, replace=False)
+		x_test, y_test = x_test[keep], y_test[keep]
+
+	# one distance matrix per distance type needed by the requested tags
+	model = PNNModel(x_train, y_train, SIGMA, TAG)
+	kinds = sorted({KERNELS[tag][0] for tag in args.tags})
+	cache_files = {}
+	for kind in kinds:
+		start = time.perf_counter()
+		cache_files[kind] = cached_distances(model, x_test, kind, args.cache_dir)
+		print(f"Distances [{kind}] ready in {time.perf_counter() - start:.2f} s -> {cache_files[kind]}")
+
+	timing_windows = [x_test[i:i + WINDOW] for i in range(0, min(x_test.shape[0], WINDOW * args.timing_windows), WINDOW)]
+	configs = [(sigma, tag) for tag in args.tags for sigma in args.sigmas]
+	with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+			initargs=(x_train, y_train, y_test, cache_files)) as pool:
+		results = list(pool.map(_evaluate, configs))
+
+	results.sort(key=lambda r: r['f1'], reverse=True)
+	if timing_windows:
+		for r in results[:args.shortlist]:
+			r['ms_per_window'] = time_config(model, (r['sigma'], r['tag']), timing_windows)
+
+	print(f"{'tag':>4} {'sigma':>12} {'precision':>10} {'recall':>10} {'f1':>10} {'ms/window':>10}")
+	for r in results:
+		ms = '-' if r['ms_per_window'] is None else f"{r['ms_per_window']:.2f}"
+		print(f"{r['tag']:>4} {r['sigma']:>12.6g} {r['precision']:>10.4f} {r['recall']:>10.4f} {r['f1']:>10.4f} {ms:>10}")
+
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+	main()
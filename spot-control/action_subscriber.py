@@ -0,0 +1,117 @@
+import collections
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'launch'))
+from memory_management import ActionEvent, ActionEventReader, Doorbell, attach_view, attach_latency_trace, \
+    ACTION_EVENTS_MEMORY_NAME, ACTION_CODE_CHANNEL, DOORBELL_TIMEOUT
+
+class ActionSubscriber:
+    """Blocking consumer of actions published by the detector (detect_human_action.publish_action).
+
+    Events are read from the action_events shared memory queue. While that segment does not exist
+    (launcher not started yet, older detector) the action code file is watched instead and every
+    rewrite of it counts as one event. Either way an action is returned once - a stale value
+    left in the file never re-triggers the robot. The subscriber outlives launcher runs: the queue
+    of a launcher started (again) after it is followed and read from its first event.
+    """
+
+    def __init__(self, endpoint_path):
+        self.endpoint_path = endpoint_path
+        self.doorbell = Doorbell(ACTION_CODE_CHANNEL)
+        self.pending = collections.deque()
+        self.last_event = None
+        self.trace = attach_latency_trace()
+        self.events = None
+        self.file_seq = 0
+        # whatever the file holds at startup is an old action
+        self.file_stamp = self._file_stamp()
+        # events already queued at startup are old actions as well
+        self.events = self._lookup()
+
+    # action queue currently behind the name, None while there is none (launcher not running)
+    def _lookup(self):
+        try:
+            return attach_view(ACTION_EVENTS_MEMORY_NAME, ActionEventReader)
+        except FileNotFoundError:
+            return None
+
+    # a queue found after startup belongs to a launcher started since - all of its events are new
+    def _attach(self):
+        self.events = self._lookup()
+        if self.events is not None:
+            self.events.rewind()
+
+    # the launcher removes its queue at exit and creates a new one when started again - the old mapping stays readable
+    # but never changes, so with nothing new the name is looked up again; True when the queue is gone or replaced
+    def _replaced(self):
+        current = self._lookup()
+        if current is not None and current.created == self.events.created:
+            current.close()
+            return False
+        self.events.close()
+        self.events = current
+        if current is not None:
+            current.rewind()
+        return True
+
+    def _file_stamp(self):
+        try:
+            return os.stat(self.endpoint_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # fallback - action code file rewritten since the last look (no trace - timestamps are the time it was noticed)
+    def _poll_file(self):
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self.file_stamp:
+            return []
+        try:
+            with open(self.endpoint_path, 'r') as f:
+                endpoint_content = f.read().strip()
+        except FileNotFoundError:
+            return []
+        if endpoint_content == '':
+            # caught between truncate and write - the write changes mtime again
+            return []
+        self.file_stamp = stamp
+        self.file_seq += 1
+        noticed = time.perf_counter()
+        return [ActionEvent(self.file_seq, int(endpoint_content), noticed, '', 0, noticed)]
+
+    # next action event (oldest first), blocking - None only if a timeout is given and passes
+    def next(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.pending:
+            if self.events is None:
+                self._attach()
+            if self.events is not None:
+                self.pending.extend(self.events.read_new())
+                if not self.pending and self._replaced():
+                    continue
+            else:
+                self.pending.extend(self._poll_file())
+            if self.pending:
+                break
+
+            wait = DOORBELL_TIMEOUT if deadline is None else min(DOORBELL_TIMEOUT, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            self.doorbell.wait(wait)
+        self.last_event = self.pending.popleft()
+        return self.last_event
+
+    # call right before the robot command for the last returned action is sent - closes its latency trace
+    def issued(self):
+        if self.last_event is None:
+            return
+        now = self.trace.span('command', self.last_event.timestamp)
+        self.trace.span('frame_to_command', self.last_event.origin, now)
+        self.last_event = None
+
+    def close(self):
+        self.doorbell.close()
+        self.trace.close()
+        if self.events is not None:
+            self.events.close()
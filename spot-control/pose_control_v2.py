@@ -31,23 +31,19 @@ from bosdyn.client.robot_command import (
 from bosdyn.client.robot_state import RobotStateClient
 
 from spot_behaviours import relative_move, sit, stand
+from action_subscriber import ActionSubscriber
 
 POSE_ENDPOINT_PATH = r'C:\Users\j.oleksiuk_ladm\Desktop\Spot Ecosystem\prod\action_code.txt'
 
-#function retrieving detected action code from endpoint (.txt file)
+# action events from the detector (shared memory queue, action code file as fallback) - opened on first get_action call
+action_subscriber = None
+
+# function retrieving detected action code - blocks until the detector publishes a new action
 def get_action():
-    while(True):
-        try:
-            with open(POSE_ENDPOINT_PATH, 'r') as f:
-                endpoint_content = f.read().strip()  # strip removes any newlines or spaces
-                if endpoint_content == '':
-                    continue
-                detected_action = int(endpoint_content)
-                return detected_action
-            
-        except FileNotFoundError:
-            print("Endpoint file not found.")
-            continue
+    global action_subscriber
+    if action_subscriber is None:
+        action_subscriber = ActionSubscriber(POSE_ENDPOINT_PATH)
+    return action_subscriber.next().action_id
 
 # function freezing - wait t second
 def countdown(t):
@@ -103,6 +99,7 @@ def run(config):
             if (action_code == 1) and (prev_action != 1):
                 
                 try:
+                    action_subscriber.issued()
                     exit_flag = not stand(command_client)
                     prev_action = 1
                 finally:
@@ -112,6 +109,7 @@ def run(config):
             if (action_code == 2) and (prev_action != 2):
                 
                 try:
+                    action_subscriber.issued()
                     exit_flag = not sit(command_client)
                 finally:
                     command_client.robot_command(RobotCommandBuilder.stop_command())
@@ -17,6 +17,7 @@ from bosdyn.client import frame_helpers
 
 from spot_behaviours import start_rotating, stop_moving, relative_move, raise_arm, move_forward
 from object_detection import detect_objects, compute_depth_to_object
+from action_subscriber import ActionSubscriber
 
 import cv2
 import numpy as np
@@ -173,20 +174,15 @@ def grab_object(img_client, manipulation_client, object_name, model):
 
         time.sleep(0.2)
 
-# function retrieving detected action code from endpoint (.txt file)
+# action events from the detector (shared memory queue, action code file as fallback) - opened on first get_action call
+action_subscriber = None
+
+# function retrieving detected action code - blocks until the detector publishes a new action
 def get_action():
-    while(True):
-        try:
-            with open(POSE_ENDPOINT_PATH, 'r') as f:
-                endpoint_content = f.read().strip()  # strip removes any newlines or spaces
-                if endpoint_content == '':
-                    continue
-                detected_action = int(endpoint_content)
-                return detected_action
-            
-        except FileNotFoundError:
-            print("Endpoint file not found.")
-            continue
+    global action_subscriber
+    if action_subscriber is None:
+        action_subscriber = ActionSubscriber(POSE_ENDPOINT_PATH)
+    return action_subscriber.next().action_id
 
 def main():
     # Initial auto-setup
@@ -217,11 +213,12 @@ def main():
             robot.power_on(timeout_sec=20)
             assert robot.is_powered_on(), "Failed to power on Spot"
 
-            # waiting for appropiate pose
+            # waiting for appropiate pose (get_action blocks until the next detected action)
             while True:
                 if not get_action() == 1: # code action 1 = sit -> stand -> sit
-                    time.sleep(0.5)
+                    continue
                 else:
+                    action_subscriber.issued()
                     blocking_stand(robot_command_client, timeout_sec=10)
                     time.sleep(1)
                     
@@ -2,6 +2,11 @@ import pandas as pd
 import numpy as np
 from scipy.signal import savgol_filter
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'body-tracker'))
+from keypoint_preprocess import select_keypoints, root_center, moving_mean, RAW_COLUMNS, COLUMNS_19, REMOVED_KEYPOINTS, KEPT_KEYPOINTS
 
 FILTERING = True
 PLOTTING = False
@@ -14,12 +19,9 @@ def apply_moving_mean(df, window_size):
     # Create a copy of the original DataFrame to avoid modifying it
     result_df = df.copy()
     
-    # Get all column names except the last one
+    # Apply moving mean to each column except the last one (label)
     columns_to_transform = df.columns[:-1]
-    
-    # Apply moving mean to each column except the last one
-    for column in columns_to_transform:
-        result_df[column] = df[column].rolling(window=window_size, min_periods=1).mean()
+    result_df[columns_to_transform] = moving_mean(df[columns_to_transform].to_numpy(dtype=np.float64), window_size)
     
     return result_df
 
@@ -28,12 +30,9 @@ def apply_SG_filter(df, window_length, polyorder):
     # Create a copy of the original DataFrame to avoid modifying it
     result_df = df.copy()
     
-    # Get all column names except the last one
+    # Apply Savitzky-Golay filter to each column except the last one (label)
     columns_to_transform = df.columns[:-1]
-    
-    # Apply moving mean to each column except the last one
-    for column in columns_to_transform:
-        result_df[column] = savgol_filter(result_df[column], window_length, polyorder)
+    result_df[columns_to_transform] = savgol_filter(df[columns_to_transform].to_numpy(dtype=np.float64), window_length, polyorder, axis=0)
 
     #plotting for debugging 
     if PLOTTING:
@@ -53,78 +52,14 @@ def process_csv(csv_file, output_file=None):
 
     # Load the CSV file
     df = pd.read_csv(csv_file)
-    df = df * (-1)
     print(f"Loaded {len(df)} rows from {csv_file}")
-    
-    # Delete columns related to specific keypoints
-    keypoints_to_remove = [7, 9, 10, 14, 16, 17, 21, 25, 27, 28, 29, 30, 31, 32, 33]
-    cols_to_drop = []
-    
-    for kp in keypoints_to_remove:
-        cols_to_drop.extend([f'x{kp}', f'y{kp}', f'z{kp}'])
-    
-    # Remove any columns that don't actually exist in the DataFrame
-    cols_to_drop = [col for col in cols_to_drop if col in df.columns]
-    
-    # Drop the columns
-    df = df.drop(columns=cols_to_drop)
-    print(f"Removed keypoint columns: {cols_to_drop}")
-    
-    # Find remaining keypoint indices
-    remaining_indices = set()
-    for col in df.columns:
-        if col.startswith('x'):
-            try:
-                idx = int(col[1:])
-                if f'x{idx}' in df.columns and f'y{idx}' in df.columns and f'z{idx}' in df.columns:
-                    remaining_indices.add(idx)
-            except ValueError:
-                pass
-    
-    print(f"Remaining keypoint indices: {sorted(remaining_indices)}")
-    
-    # Transform coordinates to make keypoint1 the origin (0,0,0)
-    if 1 in remaining_indices:
-        print("Transforming coordinates to make keypoint1 the origin (0,0,0)")
-        
-        # Process each row to transform coordinates
-        for i, row in df.iterrows():
-            # Get the coordinates of keypoint1
-            x1 = row['x1']
-            y1 = row['y1']
-            z1 = row['z1']
-            
-            # Subtract keypoint1 coordinates from all keypoints
-            for idx in remaining_indices:
-                df.at[i, f'x{idx}'] = row[f'x{idx}'] - x1
-                df.at[i, f'y{idx}'] = row[f'y{idx}'] - y1
-                df.at[i, f'z{idx}'] = row[f'z{idx}'] - z1
-        
-        # Verify keypoint1 is now at origin
-        print(f"Keypoint1 coordinates after transformation (should be ~0): x={df['x1'].mean()}, y={df['y1'].mean()}, z={df['z1'].mean()}")
-    else:
-        print("Keypoint1 not found in the data, skipping coordinate transformation")
-    
-    # Create mapping from old indices to new sequential indices
-    old_to_new = {old: new for new, old in enumerate(sorted(remaining_indices))}
-    print(f"Mapping from old to new indices: {old_to_new}")
-    
-    # Create a dictionary to store column renames
-    rename_dict = {}
-    for col in df.columns:
-        if col.startswith(('x', 'y', 'z')):
-            try:
-                prefix = col[0]  # 'x', 'y', or 'z'
-                old_idx = int(col[1:])
-                if old_idx in old_to_new:
-                    new_idx = old_to_new[old_idx]
-                    rename_dict[col] = f'{prefix}{new_idx}'
-            except ValueError:
-                pass
-    
-    # Rename the columns
-    df = df.rename(columns=rename_dict)
-    print(f"Renamed columns from old to new keypoint indices")
+
+    # rotate by 180 degree, keep the 19 keypoints of the model (renumbered 0..18) and make keypoint1 the origin (0,0,0)
+    # - the same kernel the live tracker preprocesses its windows with
+    keypoints = root_center(select_keypoints(df[RAW_COLUMNS].to_numpy()))
+    print(f"Removed keypoints: {REMOVED_KEYPOINTS}, remaining: {KEPT_KEYPOINTS.tolist()}")
+    df = pd.DataFrame(keypoints.reshape(len(df), -1), columns=COLUMNS_19, index=df.index)
+    print(f"Keypoint1 coordinates after transformation (should be ~0): x={df['x1'].mean()}, y={df['y1'].mean()}, z={df['z1'].mean()}")
     
     # Add a 'label' column with default value 'walking'
     df['label'] = ACTIVITY